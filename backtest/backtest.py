@@ -7,9 +7,44 @@
 import datetime
 import pprint
 
-import queue
 import time
 
+from event.event import MarketEvent, SignalEvent, OrderEvent, FillEvent
+from event.event_queue import EventQueue, ThreadedEventQueue, TaggedEventQueue
+from event.dispatcher import EventDispatcher
+from backtest.progress import ProgressReporter
+
+class StrategyUnit(object):
+    """
+    StrategyUnit raggruppa una strategia con il proprio portafoglio e
+    gestore di esecuzione, identificati da strategy_id, insieme ai
+    contatori dei loro segnali, ordini ed esecuzioni.
+    """
+
+    def __init__(self, strategy_id, strategy, portfolio, execution_handler):
+        self.strategy_id = strategy_id
+        self.strategy = strategy
+        self.portfolio = portfolio
+        self.execution_handler = execution_handler
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+        self.stopped = False
+
+    def summary(self):
+        """
+        Restituisce le statistiche in tempo reale del portafoglio
+        e i contatori della coppia.
+        """
+        summary = self.portfolio.stats.summary()
+        summary['strategy_id'] = self.strategy_id
+        summary['signals'] = self.signals
+        summary['orders'] = self.orders
+        summary['fills'] = self.fills
+        summary['stopped'] = self.stopped
+        return summary
+
+
 class Backtest(object):
     """
     Racchiude le impostazioni e i componenti per l'esecuzione
@@ -17,7 +52,10 @@ class Backtest(object):
     """
     def __init__(self, csv_dir, symbol_list, initial_capital,
                  heartbeat, start_date, data_handler,
-                 execution_handler, portfolio, strategy):
+                 execution_handler, portfolio, strategy, live=False,
+                 progress_interval=5.0, progress_callback=None,
+                 stop_rule=None, strategy_params=None, data_handler_params=None,
+                 date_range=None, strategies=None):
         """
         Inizializza il backtest.
 
@@ -31,6 +69,29 @@ class Backtest(object):
         execution_handler - (Classe) Gestisce gli ordini / esecuzioni per i trade.
         portfolio - (Classe) Tiene traccia del portafoglio attuale e delle posizioni precedenti.
         strategy - (Classe) Genera segnali basati sui dati di mercato.
+        live - Se True usa una coda degli eventi sincronizzata tra thread,
+            necessaria nel live trading; nel backtest storico la coda è una
+            semplice deque senza lock.
+        progress_interval - Intervallo minimo in secondi tra due segnalazioni
+            dell'avanzamento (None per disattivarle).
+        progress_callback - Funzione opzionale che riceve le informazioni
+            sull'avanzamento al posto della stampa su stdout.
+        stop_rule - Funzione opzionale che riceve le statistiche in tempo
+            reale del portafoglio (portfolio.stats) dopo ogni barra e
+            restituisce True per interrompere il backtest (es.
+            max_drawdown_rule(0.2)).
+        strategy_params - Dizionario opzionale di parametri passati al
+            costruttore della strategia (es. short_window, long_window).
+        data_handler_params - Dizionario opzionale di parametri aggiuntivi
+            passati al costruttore del data handler (es. panel_dir).
+        date_range - Tupla opzionale (start, end) che limita il backtest
+            alle barre tra le due date, incluse (vedi set_date_range).
+        strategies - Lista opzionale di strategie eseguite insieme sullo
+            stesso flusso di dati, al posto di strategy: ogni elemento è
+            una classe o una tupla (classe, parametri). Ogni strategia ha
+            un proprio portafoglio e gestore di esecuzione e il suo
+            strategy_id è la posizione nella lista; gli eventi vengono
+            marcati con strategy_id e instradati alla coppia che li ha generati.
         """
 
         self.csv_dir = csv_dir
@@ -42,12 +103,22 @@ class Backtest(object):
         self.execution_handler_cls = execution_handler
         self.portfolio_cls = portfolio
         self.strategy_cls = strategy
-        self.events = queue.Queue()
+        self.strategy_params = dict(strategy_params or {})
+        self.data_handler_params = dict(data_handler_params or {})
+        self.date_range = date_range
+        self.strategy_specs = list(strategies) if strategies is not None else None
+        self.events = ThreadedEventQueue() if live else EventQueue()
+        self.progress_interval = progress_interval
+        self.progress_callback = progress_callback
+        self.stop_rule = stop_rule
+        self.stopped = False
         self.signals = 0
         self.orders = 0
         self.fills = 0
         self.num_strats = 1
+        self.dispatcher = EventDispatcher()
         self._generate_trading_instances()
+        self._register_handlers()
 
 
     def _generate_trading_instances(self):
@@ -58,56 +129,167 @@ class Backtest(object):
         print("Creating DataHandler, Strategy, Portfolio and ExecutionHandler")
         self.data_handler = self.data_handler_cls(self.events,
                                                   self.csv_dir,
-                                                  self.symbol_list)
-        self.strategy = self.strategy_cls(self.data_handler,
-                                          self.events)
-        self.portfolio = self.portfolio_cls(self.data_handler,
-                                            self.events,
-                                            self.start_date,
-                                            self.initial_capital)
-        self.execution_handler = self.execution_handler_cls(self.events)
+                                                  self.symbol_list,
+                                                  **self.data_handler_params)
+        if self.date_range is not None:
+            self.data_handler.set_date_range(*self.date_range)
+
+        if self.strategy_specs is None:
+            specs = [(self.strategy_cls, self.strategy_params)]
+        else:
+            specs = [
+                s if isinstance(s, tuple) else (s, {}) for s in self.strategy_specs
+            ]
+        self.units = []
+        for strategy_id, (strategy_cls, params) in enumerate(specs):
+            # Con più strategie ogni coppia scrive sulla coda condivisa
+            # tramite un wrapper che marca gli eventi con il suo strategy_id
+            if self.strategy_specs is None:
+                events = self.events
+            else:
+                events = TaggedEventQueue(self.events, strategy_id)
+            strategy = strategy_cls(self.data_handler,
+                                    events,
+                                    **params)
+            portfolio = self.portfolio_cls(self.data_handler,
+                                           events,
+                                           self.start_date,
+                                           self.initial_capital)
+            execution_handler = self.execution_handler_cls(events)
+            self.units.append(
+                StrategyUnit(strategy_id, strategy, portfolio, execution_handler)
+            )
+        self.num_strats = len(self.units)
+        self.strategy = self.units[0].strategy
+        self.portfolio = self.units[0].portfolio
+        self.execution_handler = self.units[0].execution_handler
+
+
+    def _register_handlers(self):
+        """
+        Registra i gestori degli eventi dei componenti del backtest
+        nel dispatcher, insieme ai contatori di segnali, ordini ed esecuzioni.
+        Con più strategie ogni MarketEvent raggiunge tutte le coppie, mentre
+        gli altri eventi sono instradati in base al loro strategy_id.
+        """
+        if self.strategy_specs is not None:
+            for unit in self.units:
+                self.dispatcher.subscribe(MarketEvent, unit.strategy.calculate_signals)
+                self.dispatcher.subscribe(MarketEvent, unit.portfolio.update_timeindex)
+            self.dispatcher.subscribe(SignalEvent, self._route_signal)
+            self.dispatcher.subscribe(OrderEvent, self._route_order)
+            self.dispatcher.subscribe(FillEvent, self._route_fill)
+            return
+        self.dispatcher.subscribe(MarketEvent, self.strategy.calculate_signals)
+        self.dispatcher.subscribe(MarketEvent, self.portfolio.update_timeindex)
+        self.dispatcher.subscribe(SignalEvent, self._count_signal)
+        self.dispatcher.subscribe(SignalEvent, self.portfolio.update_signal)
+        self.dispatcher.subscribe(OrderEvent, self._count_order)
+        self.dispatcher.subscribe(OrderEvent, self.execution_handler.execute_order)
+        self.dispatcher.subscribe(FillEvent, self._count_fill)
+        self.dispatcher.subscribe(FillEvent, self.portfolio.update_fill)
+
+    def _count_signal(self, event):
+        self.signals += 1
+        self.units[0].signals += 1
+
+    def _count_order(self, event):
+        self.orders += 1
+        self.units[0].orders += 1
+
+    def _count_fill(self, event):
+        self.fills += 1
+        self.units[0].fills += 1
+
+    def _route_signal(self, event):
+        unit = self.units[event.strategy_id]
+        self.signals += 1
+        unit.signals += 1
+        unit.portfolio.update_signal(event)
+
+    def _route_order(self, event):
+        unit = self.units[event.strategy_id]
+        self.orders += 1
+        unit.orders += 1
+        unit.execution_handler.execute_order(event)
+
+    def _route_fill(self, event):
+        unit = self.units[event.strategy_id]
+        self.fills += 1
+        unit.fills += 1
+        unit.portfolio.update_fill(event)
+
+    def _apply_stop_rule(self, bars):
+        """
+        Applica stop_rule al portafoglio di ogni coppia ancora attiva.
+        Una coppia che soddisfa la regola smette di ricevere i MarketEvent;
+        il backtest si interrompe quando tutte le coppie sono ferme.
+        """
+        for unit in self.units:
+            if not unit.stopped and self.stop_rule(unit.portfolio.stats):
+                unit.stopped = True
+                if self.strategy_specs is not None:
+                    self.dispatcher.unsubscribe(MarketEvent, unit.strategy.calculate_signals)
+                    self.dispatcher.unsubscribe(MarketEvent, unit.portfolio.update_timeindex)
+        if all(unit.stopped for unit in self.units):
+            self.stopped = True
+            print("Backtest stopped by stop_rule after %d bars" % bars)
+        return self.stopped
 
 
     def _run_backtest(self):
         """
         Esecuzione del backtest.
         """
+        progress = None
+        if self.progress_interval is not None:
+            progress = ProgressReporter(
+                total=getattr(self.data_handler, 'bars_total', None),
+                interval=self.progress_interval,
+                callback=self.progress_callback
+            )
+            progress.start()
+
+        dispatch = self.dispatcher.dispatch
         i = 0
         while True:
-            i += 1
-            print(i)
             # Aggiornamento dei dati di mercato
             if self.data_handler.continue_backtest == True:
                 self.data_handler.update_bars()
             else:
                break
+            i += 1
             # Gestione degli eventi
-            while True:
-                try:
-                    event = self.events.get(False)
-                except queue.Empty:
-                    break
-                else:
-                    if event is not None:
-                        if event.type == 'MARKET':
-                            self.strategy.calculate_signals(event)
-                            self.portfolio.update_timeindex(event)
-                        elif event.type == 'SIGNAL':
-                            self.signals += 1
-                            self.portfolio.update_signal(event)
-                        elif event.type == 'ORDER':
-                            self.orders += 1
-                            self.execution_handler.execute_order(event)
-                        elif event.type == 'FILL':
-                            self.fills += 1
-                            self.portfolio.update_fill(event)
-            time.sleep(self.heartbeat)
+            for event in self.events.drain():
+                if event is not None:
+                    dispatch(event)
+            if progress is not None:
+                progress.update(i)
+            # Interruzione anticipata in base alle statistiche correnti
+            if self.stop_rule is not None and self._apply_stop_rule(i):
+                break
+            # Nel backtest storico senza heartbeat non si attende
+            if self.heartbeat > 0:
+                time.sleep(self.heartbeat)
+        if progress is not None:
+            progress.finish(i)
 
 
     def _output_performance(self):
         """
         Stampa delle performance della strategia dai risultati del backtest.
         """
+        if self.strategy_specs is not None:
+            for unit in self.units:
+                unit.portfolio.create_equity_curve_dataframe()
+                print("Strategy %s (%s):" % (
+                    unit.strategy_id, unit.strategy.__class__.__name__)
+                )
+                pprint.pprint(unit.portfolio.output_summary_stats())
+                print("Signals: %s, Orders: %s, Fills: %s" % (
+                    unit.signals, unit.orders, unit.fills)
+                )
+            return
         self.portfolio.create_equity_curve_dataframe()
         print("Creating summary stats...")
         stats = self.portfolio.output_summary_stats()
@@ -118,6 +300,26 @@ class Backtest(object):
         print("Orders: %s" % self.orders)
         print("Fills: %s" % self.fills)
 
+    def summary(self):
+        """
+        Restituisce un dizionario numerico con le statistiche del backtest,
+        calcolate in tempo reale dal portafoglio, e i contatori di
+        segnali, ordini ed esecuzioni. Non richiede la curva di equity.
+        """
+        summary = self.portfolio.stats.summary()
+        summary['signals'] = self.signals
+        summary['orders'] = self.orders
+        summary['fills'] = self.fills
+        summary['stopped'] = self.stopped
+        return summary
+
+    def summaries(self):
+        """
+        Restituisce la lista dei riepiloghi di ogni coppia
+        strategia/portafoglio, nell'ordine di strategy_id.
+        """
+        return [unit.summary() for unit in self.units]
+
     def simulate_trading(self):
         """
         Simula il backtest e stampa le performance del portafoglio.
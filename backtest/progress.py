@@ -0,0 +1,91 @@
+# progress.py
+
+import sys
+import time
+
+
+class ProgressReporter(object):
+    """
+    ProgressReporter segnala l'avanzamento del backtest al più una volta
+    ogni interval secondi, con il numero di barre elaborate, la velocità
+    in barre al secondo e, se il numero totale di barre è noto, la
+    percentuale completata e il tempo stimato alla fine (ETA).
+
+    Il costo per barra è un solo confronto con l'orologio, per cui può
+    restare attivo anche su backtest di milioni di barre.
+    """
+
+    def __init__(self, total=None, interval=5.0, callback=None, stream=None):
+        """
+        Inizializza il reporter.
+
+        Parametri:
+        total - Il numero totale di barre, se noto.
+        interval - L'intervallo minimo in secondi tra due segnalazioni.
+        callback - Funzione opzionale che riceve un dizionario con
+            bars, total, percent, bars_per_sec ed eta; se assente
+            l'avanzamento viene stampato su stream.
+        stream - Lo stream di output (per default sys.stdout).
+        """
+        self.total = total
+        self.interval = interval
+        self.callback = callback
+        self.stream = stream
+        self.start_time = None
+        self._next_report = None
+
+    def start(self):
+        """
+        Avvia il cronometro del backtest.
+        """
+        self.start_time = time.monotonic()
+        self._next_report = self.start_time + self.interval
+
+    def update(self, bars):
+        """
+        Registra il numero di barre elaborate e segnala l'avanzamento
+        se è trascorso almeno interval secondi dall'ultima segnalazione.
+        """
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self._report(bars, now)
+
+    def finish(self, bars):
+        """
+        Segnala l'avanzamento finale del backtest.
+        """
+        self._report(bars, time.monotonic())
+
+    def _report(self, bars, now):
+        elapsed = now - self.start_time
+        bars_per_sec = bars / elapsed if elapsed > 0 else float('nan')
+        percent = None
+        eta = None
+        if self.total:
+            percent = 100.0 * bars / self.total
+            if bars_per_sec > 0:
+                eta = max(self.total - bars, 0) / bars_per_sec
+        info = {
+            'bars': bars,
+            'total': self.total,
+            'percent': percent,
+            'bars_per_sec': bars_per_sec,
+            'eta': eta,
+        }
+        if self.callback is not None:
+            self.callback(info)
+        else:
+            self._print(info)
+
+    def _print(self, info):
+        stream = self.stream if self.stream is not None else sys.stdout
+        if info['percent'] is None:
+            line = "Bars: %d (%.0f bars/sec)" % (info['bars'], info['bars_per_sec'])
+        else:
+            line = "Bars: %d/%d (%.1f%%, %.0f bars/sec, ETA %.0fs)" % (
+                info['bars'], info['total'], info['percent'],
+                info['bars_per_sec'], info['eta'] or 0.0
+            )
+        stream.write(line + "\n")
+        stream.flush()
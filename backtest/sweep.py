@@ -0,0 +1,266 @@
+# sweep.py
+
+import contextlib
+import io
+import itertools
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from backtest.backtest import Backtest
+from data.csv_cache import CSV_COLUMNS, CSVBarCache
+from data.memmap_data import MemmapDataHandler, build_panel, panel_is_valid
+from data.shared_data import SharedMemoryDataHandler, SharedPanel
+
+
+def expand_grid(param_grid):
+    """
+    Espande una griglia di parametri nell'elenco delle combinazioni.
+
+    Parametri:
+    param_grid - Un dizionario nome -> lista di valori, di cui viene
+        calcolato il prodotto cartesiano, oppure una lista di dizionari
+        già espansi.
+    """
+    if isinstance(param_grid, dict):
+        names = list(param_grid)
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*(param_grid[n] for n in names))
+        ]
+    return [dict(p) for p in param_grid]
+
+
+def params_key(params):
+    """
+    Restituisce la chiave testuale univoca di una combinazione di parametri,
+    usata per riconoscere i punti già calcolati quando si riprende uno sweep.
+    """
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def _run_point(settings, params):
+    """
+    Esegue nel processo worker il backtest di una combinazione di
+    parametri e restituisce la riga dei risultati. Gli errori vengono
+    registrati nella colonna 'error' senza interrompere lo sweep.
+
+    Se settings contiene 'date_range' il backtest è limitato a quelle
+    date; con 'equity_curve' la riga contiene anche la serie del valore
+    totale del portafoglio ('equity').
+    """
+    row = dict(params)
+    row['params'] = params_key(params)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            backtest = Backtest(
+                settings['csv_dir'], settings['symbol_list'],
+                settings['initial_capital'], 0.0, settings['start_date'],
+                settings['data_handler'], settings['execution_handler'],
+                settings['portfolio'], settings['strategy'],
+                progress_interval=None, stop_rule=settings['stop_rule'],
+                strategy_params=params,
+                data_handler_params=settings['data_handler_params'],
+                date_range=settings.get('date_range')
+            )
+            backtest._run_backtest()
+        row.update(backtest.summary())
+        if settings.get('equity_curve'):
+            row['equity'] = backtest.portfolio.ledger.holdings_frame()['total'].copy()
+        row['error'] = ''
+    except Exception as e:
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+    return row
+
+
+def prepare_shared_data(data_handler, params, csv_dir, symbol_list,
+                        csv_format='daily'):
+    """
+    Prepara una sola volta, nel processo principale, i dati di mercato
+    che i worker condivideranno, aggiornando i parametri del data handler.
+    Restituisce il SharedPanel creato, da rimuovere con unlink() quando
+    i worker hanno terminato, oppure None.
+
+    Parametri:
+    data_handler - (Classe) Il data handler usato dai worker.
+    params - Il dizionario dei parametri del data handler (modificato).
+    csv_dir - La directory dei file CSV.
+    symbol_list - L'elenco dei simboli.
+    csv_format - Il formato dei file CSV, 'daily' o 'hft'.
+    """
+    names = CSV_COLUMNS[csv_format]
+    if issubclass(data_handler, MemmapDataHandler):
+        panel_dir = params.get('panel_dir') or os.path.join(csv_dir, 'panel')
+        if not panel_is_valid(csv_dir, symbol_list, panel_dir, names):
+            build_panel(csv_dir, symbol_list, panel_dir, names, params.get('cache_dir'))
+        params['panel_dir'] = panel_dir
+        params['csv_format'] = csv_format
+    elif issubclass(data_handler, SharedMemoryDataHandler):
+        if params.get('shared_panel') is None:
+            panel = SharedPanel(csv_dir, symbol_list, csv_format, params.get('cache_dir'))
+            params['shared_panel'] = panel.descriptor()
+            params['csv_format'] = csv_format
+            return panel
+    elif params.get('cache_dir'):
+        cache = CSVBarCache(params['cache_dir'])
+        for s in symbol_list:
+            csv_path = os.path.join(csv_dir, '%s.csv' % s)
+            if not cache.is_valid(csv_path, names):
+                cache.build(csv_path, names)
+    return None
+
+
+class ParameterSweep(object):
+    """
+    ParameterSweep esegue lo stesso backtest su una griglia di parametri
+    della strategia, distribuendo le combinazioni su tutti i core con un
+    ProcessPoolExecutor.
+
+    I dati di mercato vengono preparati una sola volta nel processo
+    principale: con MemmapDataHandler viene costruito il pannello allineato
+    su disco, che i worker aprono in memory-map in sola lettura, per cui le
+    pagine sono condivise tramite la cache del sistema operativo; con
+    SharedMemoryDataHandler il pannello viene caricato in memoria condivisa
+    e rimosso alla fine dello sweep; con gli altri data handler che
+    accettano cache_dir viene preparata la cache binaria dei CSV.
+
+    Ogni risultato viene aggiunto al file results_path (una riga JSON per
+    combinazione) appena disponibile, così uno sweep interrotto può essere
+    ripreso calcolando solo le combinazioni mancanti o fallite.
+    """
+
+    def __init__(self, csv_dir, symbol_list, initial_capital, start_date,
+                 execution_handler, portfolio, strategy, param_grid,
+                 data_handler=MemmapDataHandler, data_handler_params=None,
+                 csv_format='daily', results_path=None, max_workers=None,
+                 stop_rule=None):
+        """
+        Inizializza lo sweep.
+
+        Parametri:
+        csv_dir - Il percorso della directory dei dati CSV.
+        symbol_list - L'elenco dei simboli.
+        initial_capital - Il capitale iniziale del portafoglio.
+        start_date - La data e ora di inizio della strategia.
+        execution_handler - (Classe) Gestisce gli ordini / esecuzioni.
+        portfolio - (Classe) Il portafoglio.
+        strategy - (Classe) La strategia, che riceve i parametri come
+            argomenti del costruttore.
+        param_grid - La griglia dei parametri (vedi expand_grid).
+        data_handler - (Classe) Il data handler (per default MemmapDataHandler).
+        data_handler_params - Parametri aggiuntivi del data handler.
+        csv_format - Il formato dei file CSV, 'daily' o 'hft'.
+        results_path - File dei risultati per la ripresa dello sweep
+            (None per non salvarli).
+        max_workers - Il numero di processi (per default il numero di core).
+        stop_rule - Regola di interruzione anticipata passata a Backtest.
+        """
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.initial_capital = initial_capital
+        self.start_date = start_date
+        self.execution_handler = execution_handler
+        self.portfolio = portfolio
+        self.strategy = strategy
+        self.param_grid = expand_grid(param_grid)
+        self.data_handler = data_handler
+        self.data_handler_params = dict(data_handler_params or {})
+        self.csv_format = csv_format
+        self.results_path = results_path
+        self.max_workers = max_workers
+        self.stop_rule = stop_rule
+        self.rows = []
+
+    def _prepare_shared_data(self):
+        """
+        Prepara una sola volta i dati di mercato condivisi dai worker.
+        """
+        return prepare_shared_data(
+            self.data_handler, self.data_handler_params, self.csv_dir,
+            self.symbol_list, self.csv_format
+        )
+
+    def _load_results(self):
+        """
+        Legge i risultati già salvati, ignorando le righe incomplete
+        di uno sweep interrotto.
+        """
+        rows = []
+        if self.results_path is None or not os.path.exists(self.results_path):
+            return rows
+        with open(self.results_path) as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue
+        return rows
+
+    def _save_result(self, row):
+        if self.results_path is None:
+            return
+        with open(self.results_path, 'a') as f:
+            f.write(json.dumps(row, default=str) + "\n")
+
+    def pending(self):
+        """
+        Restituisce le combinazioni non ancora calcolate con successo.
+        """
+        done = set(r['params'] for r in self._load_results() if not r.get('error'))
+        return [p for p in self.param_grid if params_key(p) not in done]
+
+    def run(self):
+        """
+        Esegue le combinazioni mancanti e restituisce la tabella dei
+        risultati di tutta la griglia.
+        """
+        pending = self.pending()
+        print("Running %d of %d parameter combinations" % (
+            len(pending), len(self.param_grid))
+        )
+        if len(pending) > 0:
+            shared_panel = self._prepare_shared_data()
+            settings = {
+                'csv_dir': self.csv_dir,
+                'symbol_list': self.symbol_list,
+                'initial_capital': self.initial_capital,
+                'start_date': self.start_date,
+                'data_handler': self.data_handler,
+                'data_handler_params': self.data_handler_params,
+                'execution_handler': self.execution_handler,
+                'portfolio': self.portfolio,
+                'strategy': self.strategy,
+                'stop_rule': self.stop_rule,
+            }
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = [
+                        executor.submit(_run_point, settings, p) for p in pending
+                    ]
+                    for future in as_completed(futures):
+                        row = future.result()
+                        self.rows.append(row)
+                        self._save_result(row)
+            finally:
+                if shared_panel is not None:
+                    self.data_handler_params.pop('shared_panel')
+                    shared_panel.unlink()
+        return self.results()
+
+    def results(self):
+        """
+        Restituisce un DataFrame con una riga per combinazione: i parametri
+        seguiti dalle statistiche di riepilogo. Se la stessa combinazione
+        è stata calcolata più volte viene tenuto l'ultimo risultato.
+        """
+        rows = self._load_results() if self.results_path is not None else self.rows
+        if len(rows) == 0:
+            return pd.DataFrame()
+        frame = pd.DataFrame(rows)
+        frame = frame.drop_duplicates(subset='params', keep='last')
+        keys = set(params_key(p) for p in self.param_grid)
+        frame = frame[frame['params'].isin(keys)]
+        return frame.reset_index(drop=True)
@@ -0,0 +1,323 @@
+# vectorized.py
+
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+from backtest.backtest import Backtest
+from backtest.sweep import expand_grid, params_key
+from execution.execution import SimulatedExecutionHandler
+from performance.performance import create_sharpe_ratio, create_drawdowns
+from portfolio.ledger import PortfolioLedger
+from portfolio.portfolio import NaivePortfolio
+
+
+def ib_commission(quantity):
+    """
+    Versione vettoriale di FillEvent.calculate_ib_commission: restituisce
+    la commissione di Interactive Brokers per ogni quantità eseguita.
+
+    Parametri:
+    quantity - Array delle quantità (positive) eseguite.
+    """
+    quantity = np.asarray(quantity, dtype=np.float64)
+    return np.where(
+        quantity <= 500,
+        np.maximum(1.3, 0.013 * quantity),
+        np.maximum(1.3, 0.008 * quantity)
+    )
+
+
+class VectorizedBacktest(object):
+    """
+    VectorizedBacktest è un motore di backtest vettoriale alternativo a
+    Backtest, per le strategie che implementano vectorized_positions():
+    le posizioni su tutte le barre vengono calcolate in una sola volta
+    dalle serie complete dei prezzi, e da queste le esecuzioni, le
+    commissioni (con lo schema IB di FillEvent) e la curva di equity, con
+    operazioni NumPy e senza il ciclo degli eventi.
+
+    Il ledger prodotto ha le stesse righe di quello di NaivePortfolio con
+    SimulatedExecutionHandler: la riga iniziale a start_date, una riga per
+    barra con le posizioni precedenti alle esecuzioni della barra e la
+    riga finale ripetuta all'esaurimento dei dati. Le esecuzioni avvengono
+    al prezzo adj_close della barra del segnale, come in NaivePortfolio,
+    oppure fill_delay barre dopo.
+
+    Serve a selezionare rapidamente molte varianti di una strategia
+    (vedi sweep()), da confermare poi con il motore a eventi;
+    consistency_check() confronta i risultati dei due motori.
+    """
+
+    def __init__(self, csv_dir, symbol_list, initial_capital, start_date,
+                 data_handler, strategy, strategy_params=None,
+                 data_handler_params=None, date_range=None, fill_delay=0,
+                 periods=252):
+        """
+        Inizializza il backtest vettoriale caricando i dati una sola volta.
+
+        Parametri:
+        csv_dir - Il percorso della directory dei dati CSV.
+        symbol_list - L'elenco dei simboli.
+        initial_capital - Il capitale iniziale del portafoglio.
+        start_date - La data e ora di inizio della strategia.
+        data_handler - (Classe) Il data handler che carica le barre.
+        strategy - (Classe) La strategia, che implementa vectorized_positions().
+        strategy_params - Dizionario opzionale dei parametri della strategia.
+        data_handler_params - Parametri aggiuntivi del data handler.
+        date_range - Tupla opzionale (start, end) che limita il backtest
+            alle barre tra le due date, incluse.
+        fill_delay - Il numero di barre tra il segnale e l'esecuzione
+            (0 come SimulatedExecutionHandler, 1 per eseguire alla barra
+            successiva).
+        periods - Periodi per anno usati per lo Sharpe ratio di summary().
+        """
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.initial_capital = initial_capital
+        self.start_date = start_date
+        self.data_handler_cls = data_handler
+        self.strategy_cls = strategy
+        self.strategy_params = dict(strategy_params or {})
+        self.data_handler_params = dict(data_handler_params or {})
+        self.date_range = date_range
+        self.fill_delay = fill_delay
+        self.periods = periods
+
+        handler = self.data_handler_cls(
+            None, csv_dir, symbol_list, **self.data_handler_params
+        )
+        if date_range is not None:
+            handler.set_date_range(*date_range)
+        store = handler.symbol_data[symbol_list[0]]
+        self.datetimes = np.asarray(store.datetimes[store.start:store.end])
+        self.bars = dict(
+            (f, np.asarray(handler.panels[f][store.start:store.end]))
+            for f in handler.panels
+        )
+        self.ledger = None
+        self.fills = 0
+        self.traded_value = 0.0
+
+    def _target_positions(self, params):
+        """
+        Calcola le posizioni della strategia dopo ogni barra, mantenendo
+        la posizione precedente dove la strategia restituisce NaN.
+        """
+        positions = self.strategy_cls.vectorized_positions(self.bars, **params)
+        positions = pd.DataFrame(np.asarray(positions, dtype=np.float64))
+        positions = positions.ffill().fillna(0.0).values
+        if self.fill_delay > 0:
+            delayed = np.zeros_like(positions)
+            delayed[self.fill_delay:] = positions[:-self.fill_delay]
+            positions = delayed
+        return positions
+
+    def run(self, params=None):
+        """
+        Esegue il backtest con i parametri della strategia indicati (per
+        default strategy_params) e restituisce il riepilogo di summary().
+        """
+        if params is None:
+            params = self.strategy_params
+        prices = self.bars['adj_close']
+        n_bars, n_symbols = prices.shape
+        held = self._target_positions(params)
+
+        # Posizioni all'inizio di ogni barra, prima delle esecuzioni
+        before = np.zeros_like(held)
+        before[1:] = held[:-1]
+        trades = held - before
+        traded = trades != 0
+        cost = np.where(traded, trades * prices, 0.0)
+        commission = np.where(traded, ib_commission(np.abs(trades)), 0.0)
+        cash_after = self.initial_capital - np.cumsum((cost + commission).sum(axis=1))
+        commission_after = np.cumsum(commission.sum(axis=1))
+        self.fills = int(traded.sum())
+        self.traded_value = float(np.abs(cost).sum())
+
+        # Righe del ledger: iniziale, una per barra e finale ripetuta
+        rows = n_bars + 2
+        positions = np.zeros((rows, n_symbols))
+        positions[1:-1] = before
+        positions[-1] = held[-1]
+        row_prices = np.vstack((np.zeros((1, n_symbols)), prices, prices[-1:]))
+        holdings = np.zeros((rows, n_symbols + 3))
+        holdings[1:, :-3] = positions[1:] * row_prices[1:]
+        holdings[0, -3] = self.initial_capital
+        holdings[1, -3] = self.initial_capital
+        holdings[2:, -3] = cash_after
+        holdings[2:, -2] = commission_after
+        holdings[:, -1] = holdings[:, -3] + np.einsum(
+            'ij,ij->i', positions, row_prices
+        )
+        datetimes = np.concatenate((
+            [pd.Timestamp(self.start_date).value], self.datetimes, self.datetimes[-1:]
+        ))
+        self.ledger = PortfolioLedger.from_arrays(
+            self.symbol_list, datetimes, positions, holdings
+        )
+        return self.summary()
+
+    def summary(self):
+        """
+        Restituisce un dizionario con le stesse statistiche di
+        Backtest.summary(), calcolate sul ledger con operazioni vettoriali
+        secondo le regole di OnlineStats.
+        """
+        holdings = self.ledger.holdings[1:]
+        totals = holdings[:, -1]
+        finite = np.isfinite(totals)
+        totals = totals[finite]
+        n = len(totals)
+        summary = {
+            'bars': n,
+            'total': totals[-1] if n > 0 else self.initial_capital,
+            'sharpe_ratio': np.nan,
+            'drawdown': 0.0,
+            'max_drawdown': 0.0,
+            'drawdown_duration': 0,
+            'max_drawdown_duration': 0,
+            'exposure': 0.0,
+            'avg_exposure': 0.0,
+            'turnover': 0.0,
+        }
+        summary['total_return'] = summary['total'] / self.initial_capital - 1.0
+        if n > 0:
+            previous = np.concatenate(([self.initial_capital], totals[:-1]))
+            returns = totals[previous != 0] / previous[previous != 0] - 1.0
+            if len(returns) > 0 and returns.std() > 0:
+                summary['sharpe_ratio'] = (
+                    np.sqrt(self.periods) * returns.mean() / returns.std()
+                )
+
+            # Drawdown con high water mark da zero, come in OnlineStats
+            equity = totals / self.initial_capital
+            drawdown = np.maximum.accumulate(np.maximum(equity, 0.0)) - equity
+            positions = np.arange(n)
+            last_reset = np.maximum.accumulate(np.where(drawdown == 0, positions, -1))
+            duration = positions - last_reset
+            summary['drawdown'] = drawdown[-1]
+            summary['max_drawdown'] = max(drawdown.max(), 0.0)
+            summary['drawdown_duration'] = int(duration[-1])
+            summary['max_drawdown_duration'] = int(duration.max())
+
+            gross = np.nansum(np.abs(holdings[finite, :-3]), axis=1)
+            exposure = np.where(totals != 0, gross / np.where(totals != 0, totals, 1.0), 0.0)
+            summary['exposure'] = exposure[-1]
+            summary['avg_exposure'] = exposure.mean()
+            if totals.sum() != 0:
+                summary['turnover'] = self.traded_value / totals.mean()
+        summary['signals'] = self.fills
+        summary['orders'] = self.fills
+        summary['fills'] = self.fills
+        summary['stopped'] = False
+        return summary
+
+    def sweep(self, param_grid):
+        """
+        Esegue il backtest vettoriale per ogni combinazione di parametri
+        sugli stessi dati e restituisce un DataFrame con una riga per
+        combinazione, nello stesso formato di ParameterSweep.results().
+
+        Parametri:
+        param_grid - La griglia dei parametri (vedi expand_grid).
+        """
+        rows = []
+        for params in expand_grid(param_grid):
+            row = dict(params)
+            row['params'] = params_key(params)
+            try:
+                row.update(self.run(params))
+                row['error'] = ''
+            except Exception as e:
+                row['error'] = '%s: %s' % (type(e).__name__, e)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def create_equity_curve_dataframe(self):
+        """
+        Crea un DataFrame pandas dalle holdings del ledger, come
+        NaivePortfolio.create_equity_curve_dataframe().
+        """
+        curve = self.ledger.holdings_frame()
+        curve['returns'] = curve['total'].pct_change()
+        curve['equity_curve'] = (1.0+curve['returns']).cumprod()
+        self.equity_curve = curve
+
+    def output_summary_stats(self):
+        """
+        Crea l'elenco delle statistiche di riepilogo nello stesso formato
+        di NaivePortfolio.output_summary_stats(), salvando la curva di
+        equity in equity.csv.
+        """
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
+        returns = self.equity_curve['returns']
+        pnl = self.equity_curve['equity_curve']
+        sharpe_ratio = create_sharpe_ratio(returns)
+        drawdown, max_dd, dd_duration = create_drawdowns(pnl)
+        self.equity_curve['drawdown'] = drawdown
+        stats = [("Total Return", "%0.2f%%" % \
+                  ((total_return - 1.0) * 100.0)),
+                 ("Sharpe Ratio", "%0.2f" % sharpe_ratio),
+                 ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
+                 ("Drawdown Duration", "%d" % dd_duration)]
+        self.equity_curve.to_csv('equity.csv')
+        return stats
+
+    def consistency_check(self, params=None, execution_handler=SimulatedExecutionHandler,
+                          portfolio=NaivePortfolio, rtol=1e-9):
+        """
+        Esegue la stessa strategia con il motore a eventi (Backtest) e ne
+        confronta il ledger con quello del backtest vettoriale: date e
+        posizioni devono coincidere e il valore totale del portafoglio
+        deve essere uguale entro la tolleranza relativa rtol.
+
+        Parametri:
+        params - I parametri della strategia (per default strategy_params).
+        execution_handler - (Classe) Il gestore di esecuzione del Backtest.
+        portfolio - (Classe) Il portafoglio del Backtest.
+        rtol - La tolleranza relativa sul valore totale.
+
+        Restituisce un dizionario con l'esito ('consistent'), la massima
+        differenza relativa del totale e il numero di esecuzioni dei due motori.
+        """
+        if params is None:
+            params = self.strategy_params
+        self.run(params)
+        with contextlib.redirect_stdout(io.StringIO()):
+            backtest = Backtest(
+                self.csv_dir, self.symbol_list, self.initial_capital, 0.0,
+                self.start_date, self.data_handler_cls, execution_handler,
+                portfolio, self.strategy_cls, progress_interval=None,
+                strategy_params=params, data_handler_params=self.data_handler_params,
+                date_range=self.date_range
+            )
+            backtest._run_backtest()
+        event_ledger = backtest.portfolio.ledger
+
+        result = {
+            'rows': (len(self.ledger), len(event_ledger)),
+            'fills': (self.fills, backtest.fills),
+            'max_rel_diff': np.nan,
+            'consistent': False,
+        }
+        if len(self.ledger) != len(event_ledger):
+            return result
+        same_dates = (self.ledger.datetimes == event_ledger.datetimes).all()
+        same_positions = np.array_equal(self.ledger.positions, event_ledger.positions)
+        totals = self.ledger.holdings[:, -1]
+        event_totals = event_ledger.holdings[:, -1]
+        both = np.isfinite(totals) & np.isfinite(event_totals)
+        result['max_rel_diff'] = float(np.max(
+            np.abs(totals[both] - event_totals[both]) / np.abs(event_totals[both])
+        )) if both.any() else 0.0
+        result['consistent'] = bool(
+            same_dates and same_positions
+            and np.array_equal(np.isfinite(totals), np.isfinite(event_totals))
+            and result['max_rel_diff'] <= rtol
+            and self.fills == backtest.fills
+        )
+        return result
@@ -0,0 +1,245 @@
+# walk_forward.py
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest.sweep import _run_point, expand_grid, prepare_shared_data
+from data.shared_data import SharedMemoryDataHandler
+from performance.performance import create_sharpe_ratio, create_drawdowns
+
+
+def stitch_equity_curves(curves, initial_capital=1.0):
+    """
+    Unisce le serie del valore totale del portafoglio di finestre
+    consecutive in un'unica curva, concatenando i rendimenti di ogni
+    finestra (il primo valore di ogni serie è il capitale iniziale).
+
+    Parametri:
+    curves - Lista di serie pandas del valore totale, una per finestra.
+    initial_capital - Il capitale iniziale della curva unita.
+
+    Restituisce:
+    Un DataFrame con le colonne returns, equity_curve e total.
+    """
+    # L'ultima barra di ogni backtest viene registrata due volte quando
+    # il feed si esaurisce: si tiene una sola riga per data
+    curves = [c[~c.index.duplicated(keep='last')] for c in curves]
+    returns = pd.concat([c.pct_change().iloc[1:] for c in curves])
+    curve = pd.DataFrame({'returns': returns})
+    curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+    curve['total'] = initial_capital * curve['equity_curve']
+    return curve
+
+
+class WalkForward(object):
+    """
+    WalkForward esegue un'ottimizzazione walk-forward: la timeline viene
+    divisa in finestre in-sample di in_sample barre, ognuna seguita da una
+    finestra out-of-sample di out_of_sample barre. I parametri della
+    strategia sono ottimizzati su ogni finestra in-sample e la combinazione
+    migliore viene eseguita sulla finestra out-of-sample successiva; le
+    curve di equity out-of-sample sono infine unite in un'unica curva.
+
+    I dati vengono caricati una sola volta (per default in un SharedPanel)
+    e ogni backtest ne usa un intervallo tramite set_date_range(), senza
+    ricostruire il data handler dai file CSV. I backtest in-sample di tutte
+    le finestre e quelli out-of-sample sono eseguiti in parallelo.
+
+    Ogni backtest parte senza storico precedente all'inizio della propria
+    finestra, come un backtest indipendente su quel periodo.
+    """
+
+    def __init__(self, csv_dir, symbol_list, initial_capital,
+                 execution_handler, portfolio, strategy, param_grid,
+                 in_sample, out_of_sample, anchored=False,
+                 objective='sharpe_ratio', data_handler=SharedMemoryDataHandler,
+                 data_handler_params=None, csv_format='daily',
+                 max_workers=None, periods=252):
+        """
+        Inizializza il walk-forward.
+
+        Parametri:
+        csv_dir - Il percorso della directory dei dati CSV.
+        symbol_list - L'elenco dei simboli.
+        initial_capital - Il capitale iniziale di ogni backtest.
+        execution_handler - (Classe) Gestisce gli ordini / esecuzioni.
+        portfolio - (Classe) Il portafoglio.
+        strategy - (Classe) La strategia da ottimizzare.
+        param_grid - La griglia dei parametri (vedi expand_grid).
+        in_sample - Il numero di barre di ogni finestra in-sample.
+        out_of_sample - Il numero di barre di ogni finestra out-of-sample,
+            che è anche il passo con cui avanzano le finestre.
+        anchored - Se True le finestre in-sample partono tutte dalla
+            prima barra e si allungano ad ogni passo.
+        objective - La statistica di Backtest.summary() da massimizzare.
+        data_handler - (Classe) Il data handler, che deve implementare
+            set_date_range() (per default SharedMemoryDataHandler).
+        data_handler_params - Parametri aggiuntivi del data handler.
+        csv_format - Il formato dei file CSV, 'daily' o 'hft'.
+        max_workers - Il numero di processi (per default il numero di core).
+        periods - Periodi per anno usati per lo Sharpe ratio della curva unita.
+        """
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.initial_capital = initial_capital
+        self.execution_handler = execution_handler
+        self.portfolio = portfolio
+        self.strategy = strategy
+        self.param_grid = expand_grid(param_grid)
+        self.in_sample = in_sample
+        self.out_of_sample = out_of_sample
+        self.anchored = anchored
+        self.objective = objective
+        self.data_handler = data_handler
+        self.data_handler_params = dict(data_handler_params or {})
+        self.csv_format = csv_format
+        self.max_workers = max_workers
+        self.periods = periods
+        self.rows = []
+        self.equity_curve = None
+
+    def windows(self, n_bars):
+        """
+        Restituisce la lista delle finestre come tuple di indici di barra
+        (is_start, is_end, oos_start, oos_end), con estremi finali esclusi.
+        """
+        windows = []
+        k = 0
+        while True:
+            is_end = self.in_sample + k * self.out_of_sample
+            if is_end >= n_bars:
+                break
+            is_start = 0 if self.anchored else is_end - self.in_sample
+            windows.append(
+                (is_start, is_end, is_end, min(is_end + self.out_of_sample, n_bars))
+            )
+            k += 1
+        return windows
+
+    def _timeline(self):
+        """
+        Legge la timeline comune dei simboli da un data handler costruito
+        sui dati già preparati.
+        """
+        handler = self.data_handler(
+            None, self.csv_dir, self.symbol_list, **self.data_handler_params
+        )
+        return np.array(handler.symbol_data[self.symbol_list[0]].datetimes)
+
+    def _settings(self, timeline, i0, i1, equity_curve=False):
+        """
+        Costruisce le impostazioni del worker per un backtest sulle
+        barre [i0, i1). La data di inizio del portafoglio è quella della
+        barra precedente, così il capitale iniziale precede la prima barra.
+        """
+        return {
+            'csv_dir': self.csv_dir,
+            'symbol_list': self.symbol_list,
+            'initial_capital': self.initial_capital,
+            'start_date': pd.Timestamp(timeline[max(i0 - 1, 0)]),
+            'data_handler': self.data_handler,
+            'data_handler_params': self.data_handler_params,
+            'execution_handler': self.execution_handler,
+            'portfolio': self.portfolio,
+            'strategy': self.strategy,
+            'stop_rule': None,
+            'date_range': (pd.Timestamp(timeline[i0]), pd.Timestamp(timeline[i1 - 1])),
+            'equity_curve': equity_curve,
+        }
+
+    def _score(self, row):
+        value = row.get(self.objective, np.nan)
+        if row.get('error') or value is None or np.isnan(value):
+            return -np.inf
+        return value
+
+    def run(self):
+        """
+        Esegue il walk-forward e restituisce la tabella delle finestre.
+        """
+        shared_panel = prepare_shared_data(
+            self.data_handler, self.data_handler_params, self.csv_dir,
+            self.symbol_list, self.csv_format
+        )
+        try:
+            timeline = self._timeline()
+            windows = self.windows(len(timeline))
+            print("Running %d walk-forward windows x %d parameter combinations" % (
+                len(windows), len(self.param_grid))
+            )
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                # Ottimizzazione in-sample di tutte le finestre in parallelo
+                is_futures = [
+                    [
+                        executor.submit(
+                            _run_point, self._settings(timeline, w[0], w[1]), p
+                        )
+                        for p in self.param_grid
+                    ]
+                    for w in windows
+                ]
+                best = []
+                for futures in is_futures:
+                    scores = [self._score(f.result()) for f in futures]
+                    n = int(np.argmax(scores))
+                    best.append((self.param_grid[n], scores[n]))
+
+                # Esecuzione out-of-sample della combinazione migliore
+                oos_futures = [
+                    executor.submit(
+                        _run_point, self._settings(timeline, w[2], w[3], True), p
+                    )
+                    for w, (p, score) in zip(windows, best)
+                ]
+                oos_rows = [f.result() for f in oos_futures]
+        finally:
+            if shared_panel is not None:
+                self.data_handler_params.pop('shared_panel')
+                shared_panel.unlink()
+
+        self.rows = []
+        curves = []
+        for k, (w, (params, score), oos) in enumerate(zip(windows, best, oos_rows)):
+            row = {
+                'window': k,
+                'is_start': pd.Timestamp(timeline[w[0]]),
+                'is_end': pd.Timestamp(timeline[w[1] - 1]),
+                'oos_start': pd.Timestamp(timeline[w[2]]),
+                'oos_end': pd.Timestamp(timeline[w[3] - 1]),
+                'params': params,
+                'is_%s' % self.objective: score,
+            }
+            equity = oos.pop('equity', None)
+            for key, value in oos.items():
+                if key not in params and key != 'params':
+                    row['oos_%s' % key] = value
+            self.rows.append(row)
+            if equity is not None:
+                curves.append(equity)
+        if len(curves) > 0:
+            self.equity_curve = stitch_equity_curves(curves, self.initial_capital)
+        return self.results()
+
+    def results(self):
+        """
+        Restituisce un DataFrame con una riga per finestra: date, parametri
+        scelti, valore in-sample dell'obiettivo e statistiche out-of-sample.
+        """
+        return pd.DataFrame(self.rows)
+
+    def output_summary_stats(self):
+        """
+        Crea l'elenco delle statistiche di riepilogo della curva
+        out-of-sample unita, nello stesso formato di output_summary_stats
+        dei portafogli.
+        """
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
+        sharpe_ratio = create_sharpe_ratio(self.equity_curve['returns'], self.periods)
+        drawdown, max_dd, dd_duration = create_drawdowns(self.equity_curve['equity_curve'])
+        self.equity_curve['drawdown'] = drawdown
+        return [("Total Return", "%0.2f%%" % ((total_return - 1.0) * 100.0)),
+                ("Sharpe Ratio", "%0.2f" % sharpe_ratio),
+                ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
+                ("Drawdown Duration", "%d" % dd_duration)]
@@ -1,2 +1,4 @@
 from .data import *
-from .hft_data import *
\ No newline at end of file
+from .hft_data import *
+from .memmap_data import *
+from .shared_data import *
@@ -0,0 +1,101 @@
+# alignment.py
+
+import numpy as np
+
+
+def sort_by_datetime(datetimes, columns):
+    """
+    Ordina per data i timestamp e le colonne di un simbolo, se
+    non sono già ordinati.
+
+    Parametri:
+    datetimes - Array int64 dei timestamp in nanosecondi.
+    columns - Dizionario campo -> array dei valori.
+    """
+    if len(datetimes) > 1 and np.any(datetimes[1:] < datetimes[:-1]):
+        order = np.argsort(datetimes, kind='stable')
+        datetimes = datetimes[order]
+        columns = dict((c, np.asarray(v)[order]) for c, v in columns.items())
+    return datetimes, columns
+
+
+def merge_timelines(timelines):
+    """
+    Unisce gli array ordinati dei timestamp di tutti i simboli nella
+    timeline comune, ordinata e senza duplicati.
+
+    Gli array vengono concatenati e ordinati con un ordinamento stabile
+    (timsort per gli interi), che riconosce le sequenze già ordinate e
+    si comporta quindi come un merge a k vie in O(n log k).
+
+    Parametri:
+    timelines - Una lista di array int64 ordinati, uno per simbolo.
+    """
+    if len(timelines) == 0:
+        return np.empty(0, dtype=np.int64)
+    merged = np.sort(np.concatenate(timelines), kind='stable')
+    if len(merged) == 0:
+        return merged
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+def forward_fill_indices(datetimes, timeline):
+    """
+    Calcola per ogni istante della timeline l'indice dell'ultima barra
+    del simbolo disponibile in quell'istante, cioè l'equivalente di un
+    reindex(method='pad'). Gli istanti precedenti alla prima barra
+    hanno indice -1.
+
+    Parametri:
+    datetimes - Array int64 ordinato dei timestamp del simbolo.
+    timeline - La timeline comune prodotta da merge_timelines.
+    """
+    return np.searchsorted(datetimes, timeline, side='right') - 1
+
+
+def align_columns(columns, indices):
+    """
+    Costruisce le colonne allineate alla timeline comune a partire
+    dagli indici di forward-fill, con NaN dove il simbolo non ha
+    ancora barre.
+
+    Parametri:
+    columns - Dizionario campo -> array dei valori del simbolo.
+    indices - Gli indici prodotti da forward_fill_indices.
+    """
+    missing = indices < 0
+    safe = np.where(missing, 0, indices)
+    aligned = {}
+    for c, values in columns.items():
+        col = np.asarray(values, dtype=np.float64).take(safe)
+        col[missing] = np.nan
+        aligned[c] = col
+    return aligned
+
+
+def align_panels(symbol_columns, symbol_indices, fields):
+    """
+    Costruisce per ogni campo un pannello (barre x simboli) allineato alla
+    timeline comune, in ordine Fortran così che la colonna di ogni simbolo
+    sia contigua e la riga di ogni barra contenga i valori di tutti i simboli.
+
+    Parametri:
+    symbol_columns - Lista dei dizionari campo -> array, uno per simbolo.
+    symbol_indices - Lista degli indici di forward_fill_indices, uno per simbolo.
+    fields - L'elenco dei campi da allineare.
+    """
+    n_bars = len(symbol_indices[0]) if len(symbol_indices) > 0 else 0
+    panels = dict(
+        (f, np.empty((n_bars, len(symbol_columns)), dtype=np.float64, order='F'))
+        for f in fields
+    )
+    for j, (columns, indices) in enumerate(zip(symbol_columns, symbol_indices)):
+        aligned = align_columns(dict((f, columns[f]) for f in fields), indices)
+        for f in fields:
+            panels[f][:, j] = aligned[f]
+    for f in fields:
+        panels[f].setflags(write=False)
+    return panels
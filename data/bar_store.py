@@ -0,0 +1,326 @@
+# bar_store.py
+
+import numpy as np
+import pandas as pd
+
+
+def check_lookback(N, max_lookback):
+    """
+    Solleva un ValueError se vengono richieste più barre
+    di quelle mantenute nello storico.
+    """
+    if max_lookback is not None and N > max_lookback:
+        raise ValueError(
+            "Requested the last %s bars, but only %s bars of history are "
+            "retained (max_lookback=%s)." % (N, max_lookback, max_lookback)
+        )
+
+
+def date_range_indices(datetimes, start=None, end=None):
+    """
+    Restituisce l'intervallo di indici [i0, i1) delle barre con timestamp
+    compreso tra start ed end, entrambi inclusi.
+
+    Parametri:
+    datetimes - Array int64 ordinato dei timestamp in nanosecondi.
+    start - La data iniziale (None = dalla prima barra).
+    end - La data finale (None = fino all'ultima barra).
+    """
+    i0 = 0
+    i1 = len(datetimes)
+    if start is not None:
+        i0 = int(np.searchsorted(datetimes, pd.Timestamp(start).value, side='left'))
+    if end is not None:
+        i1 = int(np.searchsorted(datetimes, pd.Timestamp(end).value, side='right'))
+    return i0, max(i0, i1)
+
+
+class BarStore(object):
+    """
+    BarStore memorizza in forma colonnare le barre di un singolo simbolo:
+    un array int64 di timestamp (nanosecondi) e un array float64
+    preallocato per ogni campo (open, high, low, close, ...).
+
+    Un cursore avanza di una barra ad ogni aggiornamento, per cui le barre
+    "più recenti" sono sempre quelle nell'intervallo [0, cursor). In questo
+    modo non si crea nessun oggetto pandas per ogni barra e i valori sono
+    restituiti come scalari o slice degli array sottostanti.
+
+    Gli array sono in sola lettura, quindi le slice restituite sono viste
+    che non possono modificare lo storico e si fermano alla barra corrente.
+
+    Con max_lookback le richieste oltre la finestra indicata sollevano un
+    errore, con lo stesso comportamento di BarHistory.
+
+    Con set_range() il replay può essere limitato a un sottointervallo
+    [start, end) delle barre: le barre precedenti a start non sono visibili,
+    come se l'archivio contenesse solo quelle dell'intervallo.
+    """
+
+    def __init__(self, datetimes, columns, max_lookback=None):
+        """
+        Inizializza l'archivio delle barre.
+
+        Parametri:
+        datetimes - Array (o indice) dei timestamp delle barre, oppure
+            array int64 di nanosecondi (usato senza copie).
+        columns - Dizionario nome del campo -> array dei valori.
+        max_lookback - Il numero massimo di barre richiedibili (None = tutte).
+        """
+        datetimes = np.asarray(datetimes)
+        if datetimes.dtype != np.int64:
+            datetimes = np.asarray(datetimes, dtype='datetime64[ns]').view(np.int64)
+        self.datetimes = datetimes.view()
+        self.fields = list(columns.keys())
+        self.columns = dict(
+            (f, np.ascontiguousarray(columns[f], dtype=np.float64).view())
+            for f in self.fields
+        )
+        self.datetimes.setflags(write=False)
+        for col in self.columns.values():
+            col.setflags(write=False)
+        self.max_lookback = max_lookback
+        self.start = 0
+        self.end = len(self.datetimes)
+        self.cursor = 0
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Crea un BarStore da un DataFrame pandas indicizzato per data.
+        """
+        return cls(df.index, dict((c, df[c].values) for c in df.columns))
+
+    def __len__(self):
+        return len(self.datetimes)
+
+    def set_range(self, start=0, end=None):
+        """
+        Limita il replay alle barre con indice in [start, end) e
+        riporta il cursore all'inizio dell'intervallo.
+        """
+        self.start = start
+        self.end = len(self.datetimes) if end is None else end
+        self.cursor = start
+
+    def advance(self):
+        """
+        Sposta il cursore sulla barra successiva. Restituisce False
+        se non ci sono più barre disponibili.
+        """
+        if self.cursor < self.end:
+            self.cursor += 1
+            return True
+        return False
+
+    def _check_available(self):
+        if self.cursor == self.start:
+            raise IndexError("No bars available yet for this symbol.")
+
+    def latest_datetime(self):
+        """
+        Restituisce il timestamp dell'ultima barra.
+        """
+        self._check_available()
+        return pd.Timestamp(self.datetimes[self.cursor - 1])
+
+    def latest_value(self, field):
+        """
+        Restituisce il valore scalare del campo per l'ultima barra.
+        """
+        self._check_available()
+        return self.columns[field][self.cursor - 1]
+
+    def latest_values(self, field, N=1):
+        """
+        Restituisce una slice con i valori del campo per le ultime N
+        barre, o meno se non sono tutte disponibili.
+        """
+        check_lookback(N, self.max_lookback)
+        return self.columns[field][max(self.cursor - N, self.start):self.cursor]
+
+    def bar(self, i):
+        """
+        Costruisce la tupla (datetime, Series) della barra i-esima, nello
+        stesso formato prodotto da DataFrame.iterrows().
+        """
+        dt = pd.Timestamp(self.datetimes[i])
+        values = [self.columns[f][i] for f in self.fields]
+        return dt, pd.Series(values, index=self.fields, name=dt)
+
+    def latest_bar(self):
+        """
+        Restituisce l'ultima barra come tupla (datetime, Series).
+        """
+        self._check_available()
+        return self.bar(self.cursor - 1)
+
+    def latest_bars(self, N=1):
+        """
+        Restituisce le ultime N barre come lista di tuple (datetime, Series).
+        """
+        check_lookback(N, self.max_lookback)
+        return [self.bar(i) for i in range(max(self.cursor - N, self.start), self.cursor)]
+
+
+class BarHistory(object):
+    """
+    BarHistory accumula le barre ricevute una alla volta (ad esempio da
+    un feed live) in array colonnari contigui. Quando la capacità è
+    esaurita gli array vengono raddoppiati, per cui il costo di
+    inserimento è O(1) ammortizzato.
+
+    Se viene indicato max_lookback lo storico diventa un ring buffer di
+    dimensione fissa: ogni barra è scritta due volte (in posizione i e
+    i + max_lookback) così che le ultime N barre siano sempre contigue e
+    la memoria occupata resti costante per tutta la durata del backtest.
+
+    Espone la stessa interfaccia di lettura di BarStore e restituisce
+    viste in sola lettura sulle ultime N barre, senza copie.
+    """
+
+    def __init__(self, fields, capacity=1024, max_lookback=None):
+        """
+        Inizializza lo storico vuoto.
+
+        Parametri:
+        fields - L'elenco dei nomi dei campi di ogni barra.
+        capacity - La capacità iniziale degli array.
+        max_lookback - Il numero massimo di barre mantenute (None = tutte).
+        """
+        self.fields = list(fields)
+        self.size = 0
+        self._allocate(capacity, max_lookback)
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, capacity, max_lookback):
+        """
+        Alloca gli array vuoti, doppi in caso di ring buffer.
+        """
+        self.max_lookback = max_lookback
+        if max_lookback is not None:
+            capacity = 2 * max_lookback
+        self._datetimes = np.empty(capacity, dtype=np.int64)
+        self._columns = dict(
+            (f, np.empty(capacity, dtype=np.float64)) for f in self.fields
+        )
+
+    def set_max_lookback(self, max_lookback):
+        """
+        Imposta il numero massimo di barre mantenute. È possibile
+        solo prima di aver ricevuto la prima barra.
+        """
+        if self.size > 0:
+            raise ValueError(
+                "max_lookback cannot be changed after bars have been received."
+            )
+        self._allocate(len(self._datetimes), max_lookback)
+
+    def clear(self):
+        """
+        Svuota lo storico mantenendo gli array già allocati.
+        """
+        self.size = 0
+
+    def _grow(self):
+        """
+        Raddoppia la capacità degli array copiando le barre esistenti.
+        """
+        capacity = max(2 * len(self._datetimes), 1)
+        datetimes = np.empty(capacity, dtype=np.int64)
+        datetimes[:self.size] = self._datetimes[:self.size]
+        self._datetimes = datetimes
+        for f in self.fields:
+            col = np.empty(capacity, dtype=np.float64)
+            col[:self.size] = self._columns[f][:self.size]
+            self._columns[f] = col
+
+    def append(self, dt, values):
+        """
+        Aggiunge una barra allo storico.
+
+        Parametri:
+        dt - Il timestamp della barra (datetime o intero in nanosecondi).
+        values - I valori della barra, nello stesso ordine di fields.
+        """
+        if not isinstance(dt, (int, np.integer)):
+            dt = pd.Timestamp(dt).value
+        if self.max_lookback is None:
+            if self.size == len(self._datetimes):
+                self._grow()
+            i = self.size
+            self._datetimes[i] = dt
+            for f, v in zip(self.fields, values):
+                self._columns[f][i] = v
+        else:
+            i = self.size % self.max_lookback
+            j = i + self.max_lookback
+            self._datetimes[i] = self._datetimes[j] = dt
+            for f, v in zip(self.fields, values):
+                col = self._columns[f]
+                col[i] = col[j] = v
+        self.size += 1
+
+    def _check_available(self):
+        if self.size == 0:
+            raise IndexError("No bars available yet for this symbol.")
+
+    def _window(self, N):
+        """
+        Restituisce gli estremi [start, end) negli array delle ultime
+        N barre, o meno se non sono tutte disponibili.
+        """
+        check_lookback(N, self.max_lookback)
+        if self.max_lookback is None:
+            return max(self.size - N, 0), self.size
+        end = (self.size - 1) % self.max_lookback + self.max_lookback + 1
+        return end - min(N, self.size), end
+
+    def latest_datetime(self):
+        """
+        Restituisce il timestamp dell'ultima barra.
+        """
+        self._check_available()
+        return pd.Timestamp(self._datetimes[self._window(1)[0]])
+
+    def latest_value(self, field):
+        """
+        Restituisce il valore scalare del campo per l'ultima barra.
+        """
+        self._check_available()
+        return self._columns[field][self._window(1)[0]]
+
+    def latest_values(self, field, N=1):
+        """
+        Restituisce una vista in sola lettura con i valori del campo
+        per le ultime N barre, o meno se non sono tutte disponibili.
+        """
+        start, end = self._window(N)
+        view = self._columns[field][start:end]
+        view.flags.writeable = False
+        return view
+
+    def bar(self, i):
+        """
+        Costruisce la tupla (datetime, Series) della barra nella
+        posizione i degli array.
+        """
+        dt = pd.Timestamp(self._datetimes[i])
+        values = [self._columns[f][i] for f in self.fields]
+        return dt, pd.Series(values, index=self.fields, name=dt)
+
+    def latest_bar(self):
+        """
+        Restituisce l'ultima barra come tupla (datetime, Series).
+        """
+        self._check_available()
+        return self.bar(self._window(1)[0])
+
+    def latest_bars(self, N=1):
+        """
+        Restituisce le ultime N barre come lista di tuple (datetime, Series).
+        """
+        start, end = self._window(N)
+        return [self.bar(i) for i in range(start, end)]
@@ -0,0 +1,182 @@
+# csv_cache.py
+
+import argparse
+import hashlib
+import json
+import os, os.path
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+# Formati dei file CSV letti dai gestori dei dati storici
+CSV_COLUMNS = {
+    'daily': ['datetime', 'open', 'low', 'high', 'close', 'adj_close', 'volume'],
+    'hft': ['datetime', 'open', 'low', 'high', 'close', 'volume', 'oi'],
+}
+
+
+class CSVBarCache(object):
+    """
+    CSVBarCache converte una sola volta ogni file CSV di barre in un
+    formato binario colonnare (un file .npy per colonna più i timestamp
+    int64) all'interno di una directory di cache. Le esecuzioni successive
+    leggono i file .npy in memory-map invece di rieseguire il parsing.
+
+    Ogni voce è identificata dal percorso assoluto del CSV e viene
+    invalidata automaticamente se cambiano la data di modifica, la
+    dimensione del file o i nomi delle colonne.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Inizializza la cache.
+
+        Parametri:
+        cache_dir - La directory dove memorizzare i file binari.
+        """
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_dir(self, csv_path):
+        """
+        Restituisce la directory della voce di cache per il file CSV.
+        """
+        path = os.path.abspath(csv_path)
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, '%s-%s' % (name, digest))
+
+    def _signature(self, csv_path, names):
+        """
+        Costruisce la firma che identifica il contenuto del file CSV.
+        """
+        st = os.stat(csv_path)
+        return {
+            'path': os.path.abspath(csv_path),
+            'mtime_ns': st.st_mtime_ns,
+            'size': st.st_size,
+            'names': list(names),
+        }
+
+    def is_valid(self, csv_path, names):
+        """
+        Verifica se esiste una voce di cache aggiornata per il file CSV.
+        """
+        meta_path = os.path.join(self._entry_dir(csv_path), 'meta.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        return meta == self._signature(csv_path, names)
+
+    def build(self, csv_path, names):
+        """
+        Esegue il parsing del file CSV e scrive i file binari della voce
+        di cache. La directory viene sostituita in modo atomico, per cui
+        un'interruzione non lascia voci parziali.
+        """
+        df = pd.read_csv(
+            csv_path, header=0, index_col=0, parse_dates=True, names=names
+        )
+        entry = self._entry_dir(csv_path)
+        tmp = tempfile.mkdtemp(dir=self.cache_dir)
+        np.save(
+            os.path.join(tmp, 'datetime.npy'),
+            np.asarray(df.index, dtype='datetime64[ns]').view(np.int64)
+        )
+        for c in df.columns:
+            np.save(
+                os.path.join(tmp, '%s.npy' % c),
+                np.asarray(df[c].values, dtype=np.float64)
+            )
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(self._signature(csv_path, names), f)
+        self.invalidate(csv_path)
+        os.rename(tmp, entry)
+
+    def load(self, csv_path, names):
+        """
+        Restituisce (datetimes, columns) per il file CSV, dove datetimes è
+        l'array int64 dei timestamp e columns un dizionario campo -> array
+        float64, entrambi in memory-map. La voce di cache viene creata o
+        ricreata se mancante o non più valida.
+        """
+        if not self.is_valid(csv_path, names):
+            self.build(csv_path, names)
+        entry = self._entry_dir(csv_path)
+        datetimes = np.load(os.path.join(entry, 'datetime.npy'), mmap_mode='r')
+        columns = dict(
+            (c, np.load(os.path.join(entry, '%s.npy' % c), mmap_mode='r'))
+            for c in names[1:]
+        )
+        return datetimes, columns
+
+    def read_csv(self, csv_path, names):
+        """
+        Restituisce il contenuto del file CSV come DataFrame pandas
+        indicizzato per data, leggendolo dalla cache.
+        """
+        datetimes, columns = self.load(csv_path, names)
+        index = pd.DatetimeIndex(datetimes.view('datetime64[ns]'), name=names[0])
+        return pd.DataFrame(columns, index=index, columns=names[1:])
+
+    def invalidate(self, csv_path):
+        """
+        Rimuove la voce di cache per il file CSV, se presente.
+        """
+        entry = self._entry_dir(csv_path)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+
+    def warm(self, csv_dir, names):
+        """
+        Crea o aggiorna la voce di cache di tutti i file CSV della
+        directory e restituisce l'elenco dei file convertiti.
+        """
+        built = []
+        for fname in sorted(os.listdir(csv_dir)):
+            if not fname.endswith('.csv'):
+                continue
+            csv_path = os.path.join(csv_dir, fname)
+            if not self.is_valid(csv_path, names):
+                self.build(csv_path, names)
+                built.append(fname)
+        return built
+
+
+def read_csv_columns(csv_path, names, cache_dir=None):
+    """
+    Legge un file CSV di barre e restituisce (datetimes, columns): l'array
+    int64 dei timestamp in nanosecondi e un dizionario campo -> array.
+    Se cache_dir è indicata i dati sono letti in memory-map dalla cache
+    binaria invece di eseguire il parsing del CSV.
+    """
+    if cache_dir is not None:
+        return CSVBarCache(cache_dir).load(csv_path, names)
+    df = pd.read_csv(
+        csv_path, header=0, index_col=0, parse_dates=True, names=names
+    )
+    datetimes = np.asarray(df.index, dtype='datetime64[ns]').view(np.int64)
+    return datetimes, dict((c, df[c].values) for c in names[1:])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pre-warm the binary cache of the CSV bar files."
+    )
+    parser.add_argument('csv_dir', help="Directory of the symbol.csv files")
+    parser.add_argument('--cache-dir', required=True, help="Cache directory")
+    parser.add_argument(
+        '--format', choices=sorted(CSV_COLUMNS), default='daily',
+        help="Column layout of the CSV files"
+    )
+    args = parser.parse_args()
+
+    cache = CSVBarCache(args.cache_dir)
+    built = cache.warm(args.csv_dir, CSV_COLUMNS[args.format])
+    print("Cached %d CSV files in %s" % (len(built), args.cache_dir))
@@ -12,6 +12,12 @@ import numpy as np
 from abc import ABCMeta, abstractmethod
 
 from event.event import MarketEvent
+from indicator.indicator import IndicatorSet
+from data.bar_store import BarStore, check_lookback, date_range_indices
+from data.csv_cache import CSV_COLUMNS, read_csv_columns
+from data.alignment import (
+    align_panels, forward_fill_indices, merge_timelines, sort_by_datetime
+)
 
 
 
@@ -85,6 +91,51 @@ class DataHandler(object):
         """
         raise NotImplementedError("Should implement update_bars()")
 
+    def require_lookback(self, N):
+        """
+        Dichiara che un componente (ad esempio una strategia) ha bisogno
+        delle ultime N barre di storico. Per default lo storico non è
+        limitato e non è necessaria alcuna azione.
+        """
+        pass
+
+    def set_date_range(self, start=None, end=None):
+        """
+        Limita il replay delle barre all'intervallo di date [start, end]
+        e lo fa ripartire dall'inizio, senza ricaricare i dati.
+        """
+        raise NotImplementedError("Should implement set_date_range()")
+
+    def add_indicator(self, symbol, name, field, indicator=None, other=None):
+        """
+        Registra un indicatore incrementale sul campo field di symbol, che
+        il data handler aggiorna automaticamente ad ogni nuova barra.
+        Se indicator è None viene creato dal nome (es. 'sma_100').
+        Restituisce l'indicatore registrato.
+        """
+        return self.indicators.add(symbol, name, field, indicator, other)
+
+    def indicator(self, symbol, name):
+        """
+        Restituisce il valore corrente dell'indicatore name di symbol.
+        """
+        return self.indicators.value(symbol, name)
+
+    def get_indicator(self, symbol, name):
+        """
+        Restituisce l'oggetto indicatore name di symbol.
+        """
+        return self.indicators.get(symbol, name)
+
+    def get_latest_symbols_value(self, val_type):
+        """
+        Restituisce un array con il valore val_type dell'ultima barra di
+        tutti i simboli, nell'ordine di symbol_list.
+        """
+        return np.array([
+            self.get_latest_bar_value(s, val_type) for s in self.symbol_list
+        ])
+
 
 
 class HistoricCSVDataHandler(DataHandler):
@@ -95,7 +146,8 @@ class HistoricCSVDataHandler(DataHandler):
     modo identico a un'interfaccia di live trading.
     """
 
-    def __init__(self, events, csv_dir, symbol_list):
+    def __init__(self, events, csv_dir, symbol_list, readonly_views=False,
+                 max_lookback=None, cache_dir=None):
         """
         Inizializza il gestore dei dati storici richiedendo
         la posizione dei file CSV e un elenco di simboli.
@@ -107,14 +159,25 @@ class HistoricCSVDataHandler(DataHandler):
         events - la coda degli eventi.
         csv_dir - percorso assoluto della directory dei file CSV.
         symbol_list - Un elenco di stringhe di simboli.
+        readonly_views - Se True, get_latest_bars_values restituisce viste
+            in sola lettura sullo storico invece di copie.
+        max_lookback - Il numero massimo di barre richiedibili per simbolo,
+            'auto' per usare la finestra dichiarata dalle strategie
+            tramite require_lookback(), o None per nessun limite.
+        cache_dir - Directory della cache binaria dei file CSV (None per
+            leggere sempre i CSV).
         """
 
         self.events = events
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
+        self.readonly_views = readonly_views
+        self.max_lookback = max_lookback
+        self.cache_dir = cache_dir
 
         self.symbol_data = {}
-        self.latest_symbol_data = {}
+        self.fill_index = {}
+        self.indicators = IndicatorSet()
         self.continue_backtest = True
 
         self._open_convert_csv_files()
@@ -123,42 +186,55 @@ class HistoricCSVDataHandler(DataHandler):
     def _open_convert_csv_files(self):
         """
         Apre i file CSV dalla directory dei dati, convertendoli
-        in DataFrame pandas all'interno di un dizionario di simboli.
+        in un BarStore colonnare all'interno di un dizionario di simboli.
 
         Per questo gestore si assumerà che i dati siano
         tratto da DTN IQFeed. Così il suo formato sarà rispettato.
         """
-        comb_index = None
+        raw = {}
         for s in self.symbol_list:
-            # Carica il file CSV senza nomi delle colonne, indicizzati per data
-            self.symbol_data[s] = pd.io.parsers.read_csv(
-                                      os.path.join(self.csv_dir, '%s.csv' % s),
-                                      header=0, index_col=0, parse_dates=True,
-                                      names=['datetime','open','low','high',
-                                             'close','adj_close','volume']
-                                  )
-
-            # Combina l'indice per riempire i valori successivi
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index.union(self.symbol_data[s].index)
-
-            # Imposta il più recente symbol_data a None
-            self.latest_symbol_data[s] = []
-
-        # Indicizza nuovamente i dataframes
+            # Carica il file CSV senza nomi delle colonne, indicizzati per data,
+            # dalla cache binaria se configurata
+            raw[s] = sort_by_datetime(*read_csv_columns(
+                os.path.join(self.csv_dir, '%s.csv' % s),
+                CSV_COLUMNS['daily'], self.cache_dir
+            ))
+
+        # Costruisce la timeline comune a tutti i simboli e, per ognuno,
+        # gli indici dell'ultima barra disponibile in ogni istante
+        timeline = merge_timelines([raw[s][0] for s in self.symbol_list])
+        self.bars_total = len(timeline)
         for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad').iterrows()
-
-
-    def _get_new_bar(self, symbol):
-        """
-        Restituisce l'ultima barra dal feed di dati come una tupla di
-        (sybmbol, datetime, open, low, high, close, volume).
-        """
-        for b in self.symbol_data[symbol]:
-            yield b
+            self.fill_index[s] = forward_fill_indices(raw[s][0], timeline)
+
+        # Pannelli (barre x simboli) di ogni campo: la colonna di un simbolo
+        # alimenta il suo BarStore, la riga di una barra i valori di tutti i simboli
+        fields = CSV_COLUMNS['daily'][1:]
+        self.panels = align_panels(
+            [raw[s][1] for s in self.symbol_list],
+            [self.fill_index[s] for s in self.symbol_list], fields
+        )
+        for j, s in enumerate(self.symbol_list):
+            self.symbol_data[s] = BarStore(
+                timeline, dict((f, self.panels[f][:, j]) for f in fields)
+            )
+            if self.max_lookback != 'auto':
+                self.symbol_data[s].max_lookback = self.max_lookback
+
+
+    def require_lookback(self, N):
+        """
+        Dichiara che un componente (ad esempio una strategia) ha bisogno
+        delle ultime N barre. Con max_lookback='auto' il limite diventa
+        la richiesta più grande ricevuta, altrimenti viene verificato
+        subito che N rientri nel max_lookback configurato.
+        """
+        if self.max_lookback == 'auto':
+            for s in self.symbol_list:
+                bars = self.symbol_data[s]
+                bars.max_lookback = max(bars.max_lookback or 0, N)
+        else:
+            check_lookback(N, self.max_lookback)
 
 
     def get_latest_bar(self, symbol):
@@ -166,12 +242,12 @@ class HistoricCSVDataHandler(DataHandler):
         Restituisce l'ultima barra dalla lista latest_symbol.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            bars = self.symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-1]
+            return bars.latest_bar()
 
 
     def get_latest_bars(self, symbol, N=1):
@@ -180,11 +256,11 @@ class HistoricCSVDataHandler(DataHandler):
         o N-k se non sono tutte disponibili.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            bars = self.symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
         else:
-            return bars_list[-N:]
+            return bars.latest_bars(N)
 
 
     def get_latest_bar_datetime(self, symbol):
@@ -192,12 +268,12 @@ class HistoricCSVDataHandler(DataHandler):
         Restituisce un oggetto datetime di Python per l'ultima barra.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            bars = self.symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-1][0]
+            return bars.latest_datetime()
 
     def get_latest_bar_value(self, symbol, val_type):
         """
@@ -205,12 +281,12 @@ class HistoricCSVDataHandler(DataHandler):
         from the last bar.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            bars = self.symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return getattr(bars_list[-1][1], val_type)
+            return bars.latest_value(val_type)
 
 
     def get_latest_bars_values(self, symbol, val_type, N=1):
@@ -219,31 +295,51 @@ class HistoricCSVDataHandler(DataHandler):
         latest_symbol, o N-k se non meno disponibili.
         """
         try:
-            bars_list = self.get_latest_bars(symbol, N)
+            bars = self.symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+            values = bars.latest_values(val_type, N)
+            return values if self.readonly_views else np.array(values)
 
-    @abstractmethod
-    def update_bars(self):
+    def get_latest_symbols_value(self, val_type):
         """
-        Inserisce la barra più recente nella struttura delle barre per
-        tutti i simboli della lista di simboli.
+        Restituisce un array con il valore val_type dell'ultima barra di
+        tutti i simboli, nell'ordine di symbol_list, letto direttamente
+        dalla riga corrente del pannello del campo.
+        """
+        bars = self.symbol_data[self.symbol_list[0]]
+        if bars.cursor == bars.start:
+            raise IndexError("No bars available yet.")
+        return self.panels[val_type][bars.cursor - 1]
+
+    def set_date_range(self, start=None, end=None):
+        """
+        Limita il replay delle barre all'intervallo di date [start, end],
+        entrambe incluse (None = nessun limite), e lo fa ripartire
+        dall'inizio. I dati già caricati vengono riutilizzati, per cui
+        lo stesso gestore può servire più finestre di un walk-forward.
+
+        Parametri:
+        start - La data della prima barra dell'intervallo.
+        end - La data dell'ultima barra dell'intervallo.
         """
+        timeline = self.symbol_data[self.symbol_list[0]].datetimes
+        i0, i1 = date_range_indices(timeline, start, end)
+        for s in self.symbol_list:
+            self.symbol_data[s].set_range(i0, i1)
+        self.bars_total = i1 - i0
+        self.continue_backtest = True
 
     def update_bars(self):
         """
-        Inserisce l'ultima barra nella struttura latest_symbol_data
-        per tutti i simboli nell'elenco dei simboli.
+        Avanza il cursore del BarStore di ogni simbolo
+        nell'elenco dei simboli, rendendo disponibile l'ultima barra.
         """
         for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
+            if not self.symbol_data[s].advance():
                 self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
-        self.events.put(MarketEvent())
\ No newline at end of file
+        if self.indicators and self.continue_backtest:
+            self.indicators.update(self)
+        self.events.put(MarketEvent())
@@ -5,7 +5,15 @@ import pandas as pd
 import numpy as np
 
 from event.event import MarketEvent
+from indicator.indicator import IndicatorSet
 from data.data import DataHandler
+from data.bar_store import (
+    BarStore, BarHistory, check_lookback, date_range_indices
+)
+from data.csv_cache import CSV_COLUMNS, read_csv_columns
+from data.alignment import (
+    align_panels, forward_fill_indices, merge_timelines, sort_by_datetime
+)
 
 
 class HistoricCSVDataHandlerHFT(DataHandler):
@@ -15,7 +23,8 @@ class HistoricCSVDataHandlerHFT(DataHandler):
     un'interfaccia per ottenere la barra "più recente" in un
     modo identico a un'interfaccia di live trading.
     """
-    def __init__(self, events, csv_dir, symbol_list):
+    def __init__(self, events, csv_dir, symbol_list, readonly_views=False,
+                 max_lookback=None, cache_dir=None):
         """
         Inizializza il gestore dei dati storici richiedendo
         la posizione dei file CSV e un elenco di simboli.
@@ -27,14 +36,27 @@ class HistoricCSVDataHandlerHFT(DataHandler):
         events - la coda degli eventi.
         csv_dir - percorso assoluto della directory dei file CSV.
         symbol_list - Un elenco di stringhe di simboli.
+        readonly_views - Se True, get_latest_bars_values restituisce viste
+            in sola lettura sullo storico invece di copie.
+        max_lookback - Il numero di barre mantenute per simbolo in un ring
+            buffer di dimensione fissa, 'auto' per usare la finestra
+            dichiarata dalle strategie tramite require_lookback(), o None
+            per mantenere tutto lo storico.
+        cache_dir - Directory della cache binaria dei file CSV (None per
+            leggere sempre i CSV).
         """
 
         self.events = events
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
+        self.readonly_views = readonly_views
+        self.max_lookback = max_lookback
+        self.cache_dir = cache_dir
 
         self.symbol_data = {}
+        self.fill_index = {}
         self.latest_symbol_data = {}
+        self.indicators = IndicatorSet()
         self.continue_backtest = True
 
         self._open_convert_csv_files()
@@ -43,42 +65,71 @@ class HistoricCSVDataHandlerHFT(DataHandler):
     def _open_convert_csv_files(self):
         """
         Apre i file CSV dalla directory dei dati, convertendoli
-        in DataFrame pandas all'interno di un dizionario di simboli.
+        in un BarStore colonnare all'interno di un dizionario di simboli.
+        Lo storico delle barre già emesse è mantenuto in un BarHistory.
 
         Per questo gestore si assumerà che i dati siano
         tratto da DTN IQFeed. Così il suo formato sarà rispettato.
         """
-        comb_index = None
+        raw = {}
         for s in self.symbol_list:
-            # Carica il file CSV senza nomi delle colonne, indicizzati per data
-            self.symbol_data[s] = pd.io.parsers.read_csv(
-                                      os.path.join(self.csv_dir, '%s.csv' % s),
-                                      header=0, index_col=0, parse_dates=True,
-                                      names=['datetime','open','low','high',
-                                             'close','volume','oi']
-                                  ).sort_index()
-
-            # Combina l'indice per riempire i valori successivi
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index.union(self.symbol_data[s].index)
-
-            # Imposta il più recente symbol_data a None
-            self.latest_symbol_data[s] = []
-
-        # Indicizza nuovamente i dataframes
+            # Carica il file CSV senza nomi delle colonne, indicizzati per data,
+            # dalla cache binaria se configurata
+            raw[s] = sort_by_datetime(*read_csv_columns(
+                os.path.join(self.csv_dir, '%s.csv' % s),
+                CSV_COLUMNS['hft'], self.cache_dir
+            ))
+
+        # Costruisce la timeline comune a tutti i simboli e, per ognuno,
+        # gli indici dell'ultima barra disponibile in ogni istante
+        timeline = merge_timelines([raw[s][0] for s in self.symbol_list])
+        self.bars_total = len(timeline)
         for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad').iterrows()
+            self.fill_index[s] = forward_fill_indices(raw[s][0], timeline)
+
+        # Pannelli (barre x simboli) di ogni campo: la colonna di un simbolo
+        # alimenta il suo BarStore, la riga di una barra i valori di tutti i simboli
+        fields = CSV_COLUMNS['hft'][1:]
+        self.panels = align_panels(
+            [raw[s][1] for s in self.symbol_list],
+            [self.fill_index[s] for s in self.symbol_list], fields
+        )
+        for j, s in enumerate(self.symbol_list):
+            self.symbol_data[s] = BarStore(
+                timeline, dict((f, self.panels[f][:, j]) for f in fields)
+            )
+            self.latest_symbol_data[s] = BarHistory(
+                self.symbol_data[s].fields,
+                max_lookback=None if self.max_lookback == 'auto' else self.max_lookback
+            )
+
+
+    def require_lookback(self, N):
+        """
+        Dichiara che un componente (ad esempio una strategia) ha bisogno
+        delle ultime N barre. Con max_lookback='auto' il ring buffer viene
+        dimensionato sulla richiesta più grande ricevuta, altrimenti viene
+        verificato subito che N rientri nel max_lookback configurato.
+        """
+        if self.max_lookback == 'auto':
+            for s in self.symbol_list:
+                history = self.latest_symbol_data[s]
+                history.set_max_lookback(max(history.max_lookback or 0, N))
+        else:
+            check_lookback(N, self.max_lookback)
 
 
     def _get_new_bar(self, symbol):
         """
         Restituisce l'ultima barra dal feed di dati come una tupla di
-        (sybmbol, datetime, open, low, high, close, volume).
+        (datetime, [open, low, high, close, volume, oi]), oppure None
+        se il feed è esaurito.
         """
-        for b in self.symbol_data[symbol]:
-            yield b
+        bars = self.symbol_data[symbol]
+        if not bars.advance():
+            return None
+        i = bars.cursor - 1
+        return bars.datetimes[i], [bars.columns[f][i] for f in bars.fields]
 
 
     def get_latest_bar(self, symbol):
@@ -91,7 +142,7 @@ class HistoricCSVDataHandlerHFT(DataHandler):
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-1]
+            return bars_list.latest_bar()
 
 
     def get_latest_bars(self, symbol, N=1):
@@ -104,7 +155,7 @@ class HistoricCSVDataHandlerHFT(DataHandler):
         except KeyError:
             print("That symbol is not available in the historical data set.")
         else:
-            return bars_list[-N:]
+            return bars_list.latest_bars(N)
 
 
     def get_latest_bar_datetime(self, symbol):
@@ -117,7 +168,7 @@ class HistoricCSVDataHandlerHFT(DataHandler):
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-1][0]
+            return bars_list.latest_datetime()
 
     def get_latest_bar_value(self, symbol, val_type):
         """
@@ -130,7 +181,7 @@ class HistoricCSVDataHandlerHFT(DataHandler):
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return getattr(bars_list[-1][1], val_type)
+            return bars_list.latest_value(val_type)
 
 
     def get_latest_bars_values(self, symbol, val_type, N=1):
@@ -139,13 +190,43 @@ class HistoricCSVDataHandlerHFT(DataHandler):
         latest_symbol, o N-k se non meno disponibili.
         """
         try:
-            bars_list = self.get_latest_bars(symbol, N)
+            bars_list = self.latest_symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+            values = bars_list.latest_values(val_type, N)
+            return values if self.readonly_views else np.array(values)
+
 
+    def get_latest_symbols_value(self, val_type):
+        """
+        Restituisce un array con il valore val_type dell'ultima barra di
+        tutti i simboli, nell'ordine di symbol_list, letto direttamente
+        dalla riga corrente del pannello del campo.
+        """
+        bars = self.symbol_data[self.symbol_list[0]]
+        if bars.cursor == bars.start:
+            raise IndexError("No bars available yet.")
+        return self.panels[val_type][bars.cursor - 1]
+
+    def set_date_range(self, start=None, end=None):
+        """
+        Limita il replay delle barre all'intervallo di date [start, end],
+        entrambe incluse (None = nessun limite), e lo fa ripartire
+        dall'inizio svuotando lo storico delle barre già emesse.
+
+        Parametri:
+        start - La data della prima barra dell'intervallo.
+        end - La data dell'ultima barra dell'intervallo.
+        """
+        timeline = self.symbol_data[self.symbol_list[0]].datetimes
+        i0, i1 = date_range_indices(timeline, start, end)
+        for s in self.symbol_list:
+            self.symbol_data[s].set_range(i0, i1)
+            self.latest_symbol_data[s].clear()
+        self.bars_total = i1 - i0
+        self.continue_backtest = True
 
     def update_bars(self):
         """
@@ -153,11 +234,11 @@ class HistoricCSVDataHandlerHFT(DataHandler):
         per tutti i simboli nell'elenco dei simboli.
         """
         for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
+            bar = self._get_new_bar(s)
+            if bar is None:
                 self.continue_backtest = False
             else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
+                self.latest_symbol_data[s].append(*bar)
+        if self.indicators and self.continue_backtest:
+            self.indicators.update(self)
         self.events.put(MarketEvent())
\ No newline at end of file
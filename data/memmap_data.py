@@ -0,0 +1,184 @@
+# memmap_data.py
+
+import json
+import os, os.path
+
+import numpy as np
+
+from data.bar_store import BarStore
+from data.csv_cache import CSV_COLUMNS, CSVBarCache
+from data.alignment import (
+    align_columns, forward_fill_indices, merge_timelines, sort_by_datetime
+)
+from data.data import HistoricCSVDataHandler
+
+
+def _load_symbol_columns(csv_path, names, cache_dir):
+    """
+    Restituisce (datetimes, columns) di un file CSV di barre, ordinati
+    per data, leggendoli in memory-map dalla cache binaria.
+    """
+    return sort_by_datetime(*CSVBarCache(cache_dir).load(csv_path, names))
+
+
+def _panel_sources(csv_dir, symbol_list):
+    """
+    Restituisce la firma (mtime, dimensione) dei file CSV sorgente.
+    """
+    sources = {}
+    for s in symbol_list:
+        st = os.stat(os.path.join(csv_dir, '%s.csv' % s))
+        sources[s] = [st.st_mtime_ns, st.st_size]
+    return sources
+
+
+def build_panel(csv_dir, symbol_list, panel_dir, names, cache_dir=None):
+    """
+    Costruisce su disco un pannello allineato di barre a partire dai file
+    CSV dei simboli: un file datetime.npy con la timeline comune e un file
+    <campo>.npy di forma (barre, simboli) per ogni campo, in ordine
+    Fortran così che la colonna di ogni simbolo sia contigua.
+
+    I simboli sono elaborati uno alla volta, quindi la memoria necessaria
+    è quella di un singolo simbolo più la timeline comune.
+
+    Parametri:
+    csv_dir - La directory dei file CSV dei simboli.
+    symbol_list - L'elenco dei simboli.
+    panel_dir - La directory di destinazione del pannello.
+    names - I nomi delle colonne dei file CSV.
+    cache_dir - Directory della cache binaria dei CSV (per default
+        la sottodirectory "csv_cache" di panel_dir).
+    """
+    if not os.path.isdir(panel_dir):
+        os.makedirs(panel_dir)
+    # Ogni CSV viene letto due volte (timeline e riempimento), per cui
+    # senza una cache esplicita se ne usa una interna al pannello
+    if cache_dir is None:
+        cache_dir = os.path.join(panel_dir, 'csv_cache')
+
+    # Timeline comune: unione ordinata dei timestamp di tutti i simboli
+    timeline = merge_timelines([
+        _load_symbol_columns(
+            os.path.join(csv_dir, '%s.csv' % s), names, cache_dir
+        )[0]
+        for s in symbol_list
+    ])
+    np.save(os.path.join(panel_dir, 'datetime.npy'), timeline)
+
+    fields = names[1:]
+    panels = dict(
+        (f, np.lib.format.open_memmap(
+            os.path.join(panel_dir, '%s.npy' % f), mode='w+', dtype=np.float64,
+            shape=(len(timeline), len(symbol_list)), fortran_order=True
+        ))
+        for f in fields
+    )
+
+    # Riempie la colonna di ogni simbolo propagando in avanti l'ultimo valore
+    for j, s in enumerate(symbol_list):
+        datetimes, columns = _load_symbol_columns(
+            os.path.join(csv_dir, '%s.csv' % s), names, cache_dir
+        )
+        aligned = align_columns(columns, forward_fill_indices(datetimes, timeline))
+        for f in fields:
+            panels[f][:, j] = aligned[f]
+    for f in fields:
+        panels[f].flush()
+    del panels
+
+    meta = {
+        'symbols': list(symbol_list),
+        'names': list(names),
+        'sources': _panel_sources(csv_dir, symbol_list),
+    }
+    with open(os.path.join(panel_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def panel_is_valid(csv_dir, symbol_list, panel_dir, names):
+    """
+    Verifica se il pannello in panel_dir corrisponde ai simboli,
+    alle colonne e ai file CSV attuali.
+    """
+    try:
+        with open(os.path.join(panel_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+    return (
+        meta['symbols'] == list(symbol_list) and
+        meta['names'] == list(names) and
+        meta['sources'] == _panel_sources(csv_dir, symbol_list)
+    )
+
+
+class MemmapDataHandler(HistoricCSVDataHandler):
+    """
+    MemmapDataHandler fornisce la stessa interfaccia di
+    HistoricCSVDataHandler ma legge le barre da un pannello allineato
+    su disco aperto in memory-map. Il sistema operativo carica le pagine
+    di dati solo quando il cursore le raggiunge, per cui il tempo di avvio
+    e la memoria residente non crescono con il numero di simboli e la
+    lunghezza dello storico.
+
+    Il pannello viene creato (o ricreato) a partire dai file CSV se
+    mancante o non più allineato ai file sorgente.
+    """
+
+    def __init__(self, events, csv_dir, symbol_list, panel_dir=None,
+                 csv_format='daily', readonly_views=False,
+                 max_lookback=None, cache_dir=None):
+        """
+        Inizializza il gestore dei dati in memory-map.
+
+        Parametri:
+        events - la coda degli eventi.
+        csv_dir - percorso assoluto della directory dei file CSV.
+        symbol_list - Un elenco di stringhe di simboli.
+        panel_dir - Directory del pannello allineato (per default
+            la sottodirectory "panel" di csv_dir).
+        csv_format - Il formato dei file CSV, 'daily' o 'hft'.
+        readonly_views - Se True, get_latest_bars_values restituisce viste
+            in sola lettura sullo storico invece di copie.
+        max_lookback - Il numero massimo di barre richiedibili per simbolo,
+            'auto' o None, come in HistoricCSVDataHandler.
+        cache_dir - Directory della cache binaria dei file CSV, usata
+            durante la costruzione del pannello.
+        """
+        if panel_dir is None:
+            panel_dir = os.path.join(csv_dir, 'panel')
+        self.panel_dir = panel_dir
+        self.csv_format = csv_format
+        super(MemmapDataHandler, self).__init__(
+            events, csv_dir, symbol_list, readonly_views=readonly_views,
+            max_lookback=max_lookback, cache_dir=cache_dir
+        )
+
+
+    def _open_convert_csv_files(self):
+        """
+        Apre in memory-map il pannello allineato, costruendolo dai file
+        CSV se necessario, e crea un BarStore per ogni simbolo che punta
+        direttamente alla sua colonna del pannello.
+        """
+        names = CSV_COLUMNS[self.csv_format]
+        if not panel_is_valid(self.csv_dir, self.symbol_list, self.panel_dir, names):
+            build_panel(
+                self.csv_dir, self.symbol_list, self.panel_dir, names, self.cache_dir
+            )
+
+        datetimes = np.load(
+            os.path.join(self.panel_dir, 'datetime.npy'), mmap_mode='r'
+        )
+        self.bars_total = len(datetimes)
+        self.panels = dict(
+            (f, np.load(os.path.join(self.panel_dir, '%s.npy' % f), mmap_mode='r'))
+            for f in names[1:]
+        )
+        for j, s in enumerate(self.symbol_list):
+            self.symbol_data[s] = BarStore(
+                datetimes, dict((f, self.panels[f][:, j]) for f in names[1:])
+            )
+            if self.max_lookback != 'auto':
+                self.symbol_data[s].max_lookback = self.max_lookback
@@ -0,0 +1,263 @@
+# shared_data.py
+
+import atexit
+import os, os.path
+
+import numpy as np
+
+from multiprocessing import resource_tracker, shared_memory
+
+from data.bar_store import BarStore
+from data.csv_cache import CSV_COLUMNS, read_csv_columns
+from data.alignment import (
+    align_columns, forward_fill_indices, merge_timelines, sort_by_datetime
+)
+from data.data import HistoricCSVDataHandler
+
+
+def _attach_segment(name):
+    """
+    Collega un segmento di memoria condivisa esistente senza registrarlo
+    nel resource tracker, che altrimenti lo rimuoverebbe all'uscita del
+    processo figlio mentre il processo principale lo sta ancora usando.
+    """
+    try:
+        # Python >= 3.13
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedPanel(object):
+    """
+    SharedPanel carica una sola volta i file CSV dei simboli e ne copia il
+    pannello allineato (timeline comune e una matrice barre x simboli per
+    campo) in segmenti di multiprocessing.shared_memory.
+
+    I processi figli si collegano agli stessi segmenti con attach(), o
+    ricevendo direttamente l'oggetto SharedPanel come argomento, e vi
+    costruiscono sopra array NumPy in sola lettura senza copie, per cui la
+    memoria occupata non cresce con il numero di processi.
+
+    Il processo che crea il pannello ne è il proprietario: i segmenti
+    vengono rimossi con unlink(), all'uscita da un blocco with o, in ogni
+    caso, alla terminazione del processo principale.
+    """
+
+    def __init__(self, csv_dir, symbol_list, csv_format='daily', cache_dir=None):
+        """
+        Crea il pannello condiviso a partire dai file CSV.
+
+        Parametri:
+        csv_dir - percorso assoluto della directory dei file CSV.
+        symbol_list - Un elenco di stringhe di simboli.
+        csv_format - Il formato dei file CSV, 'daily' o 'hft'.
+        cache_dir - Directory della cache binaria dei file CSV.
+        """
+        names = CSV_COLUMNS[csv_format]
+        self.symbol_list = list(symbol_list)
+        self.fields = names[1:]
+        self.owner = True
+        self.segments = {}
+
+        raw = [
+            sort_by_datetime(*read_csv_columns(
+                os.path.join(csv_dir, '%s.csv' % s), names, cache_dir
+            ))
+            for s in self.symbol_list
+        ]
+        timeline = merge_timelines([r[0] for r in raw])
+        self.bars = len(timeline)
+
+        try:
+            self.datetimes = self._create('datetime', (self.bars,), np.int64)
+            self.datetimes[:] = timeline
+            self.panels = dict(
+                (f, self._create(f, (self.bars, len(self.symbol_list)), np.float64))
+                for f in self.fields
+            )
+            # I simboli sono allineati uno alla volta direttamente nei
+            # segmenti condivisi, senza un pannello intermedio in memoria
+            for j, (datetimes, columns) in enumerate(raw):
+                aligned = align_columns(
+                    dict((f, columns[f]) for f in self.fields),
+                    forward_fill_indices(datetimes, timeline)
+                )
+                for f in self.fields:
+                    self.panels[f][:, j] = aligned[f]
+        except BaseException:
+            self.unlink()
+            raise
+        self._set_readonly()
+        atexit.register(self.unlink)
+
+    def _create(self, key, shape, dtype):
+        """
+        Crea un segmento condiviso e l'array NumPy (in ordine Fortran)
+        che lo occupa.
+        """
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.segments[key] = shm
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf, order='F')
+
+    def _set_readonly(self):
+        self.datetimes.setflags(write=False)
+        for f in self.fields:
+            self.panels[f].setflags(write=False)
+
+    def descriptor(self):
+        """
+        Restituisce la descrizione serializzabile del pannello (nomi dei
+        segmenti, forma e campi) necessaria per collegarsi ai segmenti.
+        """
+        return {
+            'symbol_list': self.symbol_list,
+            'fields': self.fields,
+            'bars': self.bars,
+            'segments': dict((k, shm.name) for k, shm in self.segments.items()),
+        }
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        Si collega, senza copie e senza diventarne proprietario, a un
+        pannello condiviso creato da un altro processo.
+
+        Parametri:
+        descriptor - Il dizionario restituito da descriptor().
+        """
+        panel = cls.__new__(cls)
+        panel.symbol_list = list(descriptor['symbol_list'])
+        panel.fields = list(descriptor['fields'])
+        panel.bars = descriptor['bars']
+        panel.owner = False
+        panel.segments = dict(
+            (k, _attach_segment(name)) for k, name in descriptor['segments'].items()
+        )
+        n = len(panel.symbol_list)
+        panel.datetimes = np.ndarray(
+            (panel.bars,), dtype=np.int64, buffer=panel.segments['datetime'].buf
+        )
+        panel.panels = dict(
+            (f, np.ndarray((panel.bars, n), dtype=np.float64,
+                           buffer=panel.segments[f].buf, order='F'))
+            for f in panel.fields
+        )
+        panel._set_readonly()
+        return panel
+
+    def __reduce__(self):
+        # Inviato a un altro processo, il pannello vi viene ricollegato
+        # ai segmenti esistenti invece di essere copiato
+        return (SharedPanel.attach, (self.descriptor(),))
+
+    def close(self):
+        """
+        Chiude i segmenti in questo processo. Gli array del pannello
+        non sono più utilizzabili dopo la chiusura.
+        """
+        self.datetimes = None
+        self.panels = {}
+        for shm in self.segments.values():
+            try:
+                shm.close()
+            except BufferError:
+                # Esistono ancora viste sugli array (es. un data handler
+                # attivo): la memoria verrà rilasciata all'uscita
+                pass
+
+    def unlink(self):
+        """
+        Chiude e rimuove i segmenti condivisi. Ha effetto solo nel
+        processo proprietario e può essere chiamato più volte.
+        """
+        if not self.owner:
+            return
+        self.close()
+        for shm in self.segments.values():
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.segments = {}
+        self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+class SharedMemoryDataHandler(HistoricCSVDataHandler):
+    """
+    SharedMemoryDataHandler fornisce la stessa interfaccia di
+    HistoricCSVDataHandler ma legge le barre da un SharedPanel in memoria
+    condivisa, per cui più backtest eseguiti in processi diversi usano la
+    stessa copia dei dati invece di rileggere e convertire i file CSV.
+    """
+
+    def __init__(self, events, csv_dir, symbol_list, shared_panel=None,
+                 csv_format='daily', readonly_views=False,
+                 max_lookback=None, cache_dir=None):
+        """
+        Inizializza il gestore dei dati in memoria condivisa.
+
+        Parametri:
+        events - la coda degli eventi.
+        csv_dir - percorso assoluto della directory dei file CSV.
+        symbol_list - Un elenco di stringhe di simboli, tutti presenti
+            nel pannello condiviso.
+        shared_panel - Il SharedPanel, o il suo descriptor(), a cui
+            collegarsi; se None il pannello viene creato dai file CSV
+            e appartiene a questo gestore.
+        csv_format - Il formato dei file CSV, 'daily' o 'hft'.
+        readonly_views - Se True, get_latest_bars_values restituisce viste
+            in sola lettura sullo storico invece di copie.
+        max_lookback - Il numero massimo di barre richiedibili per simbolo,
+            'auto' o None, come in HistoricCSVDataHandler.
+        cache_dir - Directory della cache binaria dei file CSV, usata
+            solo se il pannello viene creato da questo gestore.
+        """
+        if isinstance(shared_panel, dict):
+            shared_panel = SharedPanel.attach(shared_panel)
+        self.shared_panel = shared_panel
+        self.csv_format = csv_format
+        super(SharedMemoryDataHandler, self).__init__(
+            events, csv_dir, symbol_list, readonly_views=readonly_views,
+            max_lookback=max_lookback, cache_dir=cache_dir
+        )
+
+
+    def _open_convert_csv_files(self):
+        """
+        Crea un BarStore per ogni simbolo che punta direttamente alla sua
+        colonna del pannello condiviso.
+        """
+        if self.shared_panel is None:
+            self.shared_panel = SharedPanel(
+                self.csv_dir, self.symbol_list, self.csv_format, self.cache_dir
+            )
+        panel = self.shared_panel
+        columns = [panel.symbol_list.index(s) for s in self.symbol_list]
+        self.bars_total = panel.bars
+        if columns == list(range(len(panel.symbol_list))):
+            self.panels = panel.panels
+        else:
+            self.panels = dict(
+                (f, np.asfortranarray(panel.panels[f][:, columns]))
+                for f in panel.fields
+            )
+        for s, j in zip(self.symbol_list, columns):
+            self.symbol_data[s] = BarStore(
+                panel.datetimes, dict((f, panel.panels[f][:, j]) for f in panel.fields)
+            )
+            if self.max_lookback != 'auto':
+                self.symbol_data[s].max_lookback = self.max_lookback
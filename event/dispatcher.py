@@ -0,0 +1,57 @@
+# dispatcher.py
+
+
+class EventDispatcher(object):
+    """
+    EventDispatcher instrada ogni evento ai gestori registrati per la sua
+    classe, sostituendo la catena di confronti sulle stringhe di event.type.
+
+    Più componenti (ad esempio diverse strategie e portafogli) possono
+    registrarsi sullo stesso tipo di evento e vengono chiamati nell'ordine
+    di registrazione. Un gestore registrato su una classe riceve anche gli
+    eventi delle sue sottoclassi.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._routes = {}
+
+    def subscribe(self, event_cls, handler):
+        """
+        Registra un gestore per una classe di eventi.
+
+        Parametri:
+        event_cls - La classe di eventi (es. MarketEvent).
+        handler - Funzione che riceve l'evento come unico parametro.
+        """
+        self._handlers.setdefault(event_cls, []).append(handler)
+        self._routes.clear()
+
+    def unsubscribe(self, event_cls, handler):
+        """
+        Rimuove un gestore registrato per una classe di eventi.
+        """
+        self._handlers[event_cls].remove(handler)
+        self._routes.clear()
+
+    def _resolve(self, event_cls):
+        """
+        Calcola e memorizza la tupla dei gestori per una classe di eventi,
+        seguendo l'ordine di risoluzione dei metodi (MRO) della classe.
+        """
+        handlers = []
+        for cls in reversed(event_cls.__mro__):
+            handlers.extend(self._handlers.get(cls, ()))
+        route = self._routes[event_cls] = tuple(handlers)
+        return route
+
+    def dispatch(self, event):
+        """
+        Invia l'evento a tutti i gestori registrati per la sua classe.
+        """
+        try:
+            route = self._routes[event.__class__]
+        except KeyError:
+            route = self._resolve(event.__class__)
+        for handler in route:
+            handler(event)
@@ -9,8 +9,11 @@ class Event(object):
     Event è la classe base che fornisce un'interfaccia per tutti
     i tipi di sottoeventi (ereditati), che attiverà ulteriori
     eventi nell'infrastruttura di trading.
+
+    Gli eventi usano __slots__ invece del __dict__ di ogni istanza,
+    e il tipo dell'evento è un attributo di classe.
     """
-    pass
+    __slots__ = ()
 
 
 
@@ -18,13 +21,26 @@ class MarketEvent(Event):
     """
     Gestisce l'evento di ricezione di un nuovo aggiornamento dei
     dati di mercato con le corrispondenti barre.
+
+    Il MarketEvent non contiene dati, per cui viene creata una sola
+    istanza che è riutilizzata ad ogni barra.
     """
+    __slots__ = ()
+    type = 'MARKET'
+    _instance = None
+
+    def __new__(cls):
+        instance = cls.__dict__.get('_instance')
+        if instance is None:
+            instance = super(MarketEvent, cls).__new__(cls)
+            cls._instance = instance
+        return instance
 
     def __init__(self):
         """
         Inizializzazione del MarketEvent.
         """
-        self.type = 'MARKET'
+        pass
 
 
 
@@ -34,6 +50,8 @@ class SignalEvent(Event):
     Gestisce l'evento di invio di un Segnale da un oggetto Strategia.
     Questo viene ricevuto da un oggetto Portfolio e si agisce su di esso.
     """
+    __slots__ = ('strategy_id', 'symbol', 'datetime', 'signal_type', 'strength')
+    type = 'SIGNAL'
 
     def __init__(self, strategy_id, symbol, datetime, signal_type, strength):
         """
@@ -45,7 +63,6 @@ class SignalEvent(Event):
         signal_type - 'LONG' o 'SHORT'.
         """
 
-        self.type = 'SIGNAL'
         self.strategy_id = strategy_id
         self.symbol = symbol
         self.datetime = datetime
@@ -61,8 +78,10 @@ class OrderEvent(Event):
     L'ordine contiene un simbolo (ad esempio GOOG), un tipo di ordine
     (a mercato o limite), una quantità e una direzione.
     """
+    __slots__ = ('symbol', 'order_type', 'quantity', 'direction', 'strategy_id')
+    type = 'ORDER'
 
-    def __init__(self, symbol, order_type, quantity, direction):
+    def __init__(self, symbol, order_type, quantity, direction, strategy_id=None):
         """
         Inizializza il tipo di ordine, impostando se è un ordine a mercato
         ('MKT') o un ordine limite ('LMT'), la quantità (integral)
@@ -73,13 +92,15 @@ class OrderEvent(Event):
         order_type - 'MKT' o 'LMT' per ordine Market or Limit.
         quantity - Intero non negativo per la quantità.
         direction - 'BUY' o 'SELL' per long o short.
+        strategy_id - La strategia che ha originato l'ordine, usata per
+            instradare l'ordine quando più strategie sono in esecuzione.
         """
 
-        self.type = 'ORDER'
         self.symbol = symbol
         self.order_type = order_type
         self.quantity = quantity
         self.direction = direction
+        self.strategy_id = strategy_id
 
     def print_order(self):
         """
@@ -99,9 +120,14 @@ class FillEvent(Event):
     uno strumento e a quale prezzo. Inoltre, memorizza
     la commissione del trade applicata dal broker.
     """
+    __slots__ = (
+        'timeindex', 'symbol', 'exchange', 'quantity',
+        'direction', 'fill_cost', 'commission', 'strategy_id'
+    )
+    type = 'FILL'
 
     def __init__(self, timeindex, symbol, exchange, quantity,
-                 direction, fill_cost, commission=None):
+                 direction, fill_cost, commission=None, strategy_id=None):
         """
         Inizializza l'oggetto FillEvent. Imposta il simbolo, il broker,
         la quantità, la direzione, il costo di esecuzione e una
@@ -119,15 +145,16 @@ class FillEvent(Event):
         direction - La direzione dell'esecuzione ('BUY' o 'SELL')
         fill_cost - Il valore nominale in dollari.
         commission - La commissione opzionale inviata da IB.
+        strategy_id - La strategia che ha originato l'ordine eseguito.
         """
 
-        self.type = 'FILL'
         self.timeindex = timeindex
         self.symbol = symbol
         self.exchange = exchange
         self.quantity = quantity
         self.direction = direction
         self.fill_cost = fill_cost
+        self.strategy_id = strategy_id
 
         # Calcolo della commissione
         if commission is None:
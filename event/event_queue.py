@@ -0,0 +1,99 @@
+# event_queue.py
+
+import queue
+
+from collections import deque
+
+
+class EventQueue(deque):
+    """
+    EventQueue è la coda degli eventi usata nel backtest, dove il ciclo
+    degli eventi è eseguito da un solo thread. È basata su collections.deque,
+    per cui put() e drain() non acquisiscono alcun lock e la fine della
+    coda non viene segnalata tramite un'eccezione.
+
+    Mantiene l'interfaccia di queue.Queue usata dai componenti (put, get,
+    empty, qsize), così strategie, portafogli e gestori di esecuzione
+    funzionano senza modifiche.
+    """
+
+    put = deque.append
+    put_nowait = deque.append
+
+    def get(self, block=False, timeout=None):
+        """
+        Estrae il primo evento della coda. Come queue.Queue.get(False)
+        solleva queue.Empty se la coda è vuota.
+        """
+        try:
+            return self.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    get_nowait = get
+
+    def empty(self):
+        return not self
+
+    def qsize(self):
+        return len(self)
+
+    def drain(self):
+        """
+        Restituisce gli eventi della coda uno alla volta, fino a
+        svuotarla, inclusi quelli aggiunti durante l'iterazione.
+        """
+        popleft = self.popleft
+        while self:
+            yield popleft()
+
+
+class ThreadedEventQueue(queue.Queue):
+    """
+    ThreadedEventQueue è la coda degli eventi sincronizzata, da usare nel
+    live trading quando gli eventi sono prodotti da altri thread (ad esempio
+    le callback del broker). Espone lo stesso metodo drain() di EventQueue.
+    """
+
+    def drain(self):
+        """
+        Restituisce gli eventi della coda uno alla volta, fino a svuotarla.
+        """
+        while True:
+            try:
+                yield self.get(False)
+            except queue.Empty:
+                return
+
+
+class TaggedEventQueue(object):
+    """
+    TaggedEventQueue avvolge la coda degli eventi condivisa e assegna
+    strategy_id a ogni evento inserito (segnali, ordini ed esecuzioni),
+    così che più coppie strategia/portafoglio possano usare la stessa coda
+    e il backtest possa instradare ogni evento alla coppia che lo ha
+    generato. Il MarketEvent, che non ha strategy_id, resta invariato.
+
+    Tutti gli altri metodi sono quelli della coda avvolta.
+    """
+
+    def __init__(self, events, strategy_id):
+        """
+        Parametri:
+        events - La coda degli eventi condivisa.
+        strategy_id - L'identificativo assegnato agli eventi.
+        """
+        self.events = events
+        self.strategy_id = strategy_id
+
+    def put(self, event, *args, **kwargs):
+        try:
+            event.strategy_id = self.strategy_id
+        except AttributeError:
+            pass
+        self.events.put(event, *args, **kwargs)
+
+    put_nowait = put
+
+    def __getattr__(self, name):
+        return getattr(self.events, name)
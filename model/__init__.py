@@ -1 +1,3 @@
-from .forecast import *
\ No newline at end of file
+from .forecast import *
+from .feature_store import *
+from .evaluation import *
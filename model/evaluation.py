@@ -0,0 +1,227 @@
+# evaluation.py
+
+import hashlib
+import json
+import os, os.path
+import pickle
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import confusion_matrix
+
+
+def time_series_folds(n, n_splits=5, test_size=None, max_train_size=None,
+                      start_test=None, index=None):
+    """
+    Restituisce le coppie (indici di training, indici di test) della
+    cross-validation per serie temporali: ogni blocco di test segue il
+    proprio training, come in sklearn TimeSeriesSplit.
+
+    Parametri:
+    n - Il numero di righe, in ordine temporale.
+    n_splits - Il numero di blocchi di test.
+    test_size - Le righe di ogni blocco di test (per default
+        n // (n_splits + 1)).
+    max_train_size - Se indicato, il training usa solo le ultime
+        max_train_size righe prima del test (finestra mobile).
+    start_test - Se indicata, un'unica divisione: training prima di
+        questa data e test dalla data in poi (richiede index).
+    index - L'indice temporale delle righe, usato con start_test.
+    """
+    positions = np.arange(n)
+    if start_test is not None:
+        split = int(np.searchsorted(np.asarray(index), np.datetime64(start_test)))
+        return [(positions[:split], positions[split:])]
+    if test_size is None:
+        test_size = n // (n_splits + 1)
+    folds = []
+    for k in range(n_splits):
+        test_start = n - (n_splits - k) * test_size
+        train_start = 0 if max_train_size is None else max(test_start - max_train_size, 0)
+        folds.append((
+            positions[train_start:test_start],
+            positions[test_start:test_start + test_size]
+        ))
+    return folds
+
+
+def data_hash(X, y):
+    """
+    Restituisce l'hash del contenuto dei dati di training (valori,
+    indice e nomi delle colonne), usato nella chiave dei modelli in cache.
+
+    Parametri:
+    X - DataFrame delle feature.
+    y - Serie della variabile da prevedere.
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps([str(c) for c in X.columns]).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(X, index=True).values.tobytes())
+    h.update(pd.util.hash_pandas_object(y, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def model_key(model, X, y):
+    """
+    Restituisce la chiave di un modello addestrato: classe, parametri
+    e hash dei dati di training.
+    """
+    params = json.dumps(model.get_params(), sort_keys=True, default=repr)
+    key = '%s.%s|%s|%s' % (
+        type(model).__module__, type(model).__name__, params, data_hash(X, y)
+    )
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _evaluate_model(name, fold, model, X_train, y_train, X_test, y_test,
+                    labels, cache_dir):
+    """
+    Addestra (o legge dalla cache) un modello su un fold ed esegue la
+    previsione sul test, nel processo worker. Restituisce la riga dei
+    risultati; gli errori vengono registrati nella colonna 'error'.
+    """
+    row = {'model': name, 'fold': fold, 'train_size': len(X_train),
+           'test_size': len(X_test), 'cached': False}
+    try:
+        path = None
+        if cache_dir is not None:
+            path = os.path.join(
+                cache_dir, '%s-%s.pkl' % (name, model_key(model, X_train, y_train))
+            )
+        start = time.time()
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+            row['cached'] = True
+        else:
+            model.fit(X_train, y_train)
+            if path is not None:
+                # Scrittura atomica: un'interruzione non lascia file parziali
+                fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(model, f)
+                os.replace(tmp, path)
+        row['fit_time'] = time.time() - start
+
+        start = time.time()
+        pred = model.predict(X_test)
+        row['predict_time'] = time.time() - start
+
+        row['hit_rate'] = float(np.mean(np.asarray(pred) == np.asarray(y_test)))
+        row['confusion_matrix'] = confusion_matrix(y_test, pred, labels=labels)
+        row['error'] = ''
+    except Exception as e:
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+    return row
+
+
+class ModelComparison(object):
+    """
+    ModelComparison confronta più modelli di classificazione (con
+    l'interfaccia fit / predict di scikit-learn) sugli stessi dati con una
+    cross-validation per serie temporali, addestrando in parallelo tutte
+    le coppie modello x fold su più processi con un ProcessPoolExecutor.
+
+    I modelli addestrati possono essere salvati in cache_dir con una
+    chiave data dalla classe, dai parametri del modello e dall'hash dei
+    dati di training, così una nuova esecuzione sugli stessi dati
+    riaddestra solo i modelli nuovi o modificati.
+
+    Per ogni modello vengono riportati hit rate, matrice di confusione
+    (righe = classe reale, colonne = classe prevista) e tempi di
+    addestramento e previsione.
+    """
+
+    def __init__(self, models, X, y, n_splits=5, test_size=None,
+                 max_train_size=None, start_test=None, cache_dir=None,
+                 max_workers=None):
+        """
+        Inizializza il confronto.
+
+        Parametri:
+        models - Lista di tuple (nome, modello).
+        X - DataFrame delle feature, in ordine temporale.
+        y - Serie della variabile da prevedere.
+        n_splits, test_size, max_train_size, start_test - I fold della
+            cross-validation (vedi time_series_folds).
+        cache_dir - Directory dei modelli addestrati (None per non salvarli).
+        max_workers - Il numero di processi (per default il numero di core).
+        """
+        self.models = list(models)
+        self.X = X
+        self.y = y
+        self.folds = time_series_folds(
+            len(X), n_splits, test_size, max_train_size, start_test, X.index
+        )
+        self.labels = np.unique(np.asarray(y))
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.rows = []
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def run(self):
+        """
+        Addestra e valuta tutti i modelli su tutti i fold e restituisce
+        la tabella dei risultati per fold.
+        """
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    _evaluate_model, name, k, model,
+                    self.X.iloc[train], self.y.iloc[train],
+                    self.X.iloc[test], self.y.iloc[test],
+                    self.labels, self.cache_dir
+                )
+                for name, model in self.models
+                for k, (train, test) in enumerate(self.folds)
+            ]
+            self.rows = [f.result() for f in futures]
+        return self.results()
+
+    def results(self):
+        """
+        Restituisce un DataFrame con una riga per modello e fold.
+        """
+        return pd.DataFrame(self.rows)
+
+    def summary(self):
+        """
+        Restituisce un DataFrame con una riga per modello: hit rate sulle
+        previsioni di tutti i fold, matrice di confusione complessiva e
+        tempi totali di addestramento e previsione.
+        """
+        rows = []
+        for name, model in self.models:
+            folds = [r for r in self.rows if r['model'] == name]
+            ok = [r for r in folds if not r['error']]
+            row = {'model': name, 'folds': len(ok)}
+            if len(ok) > 0:
+                cm = sum(r['confusion_matrix'] for r in ok)
+                row['hit_rate'] = np.trace(cm) / float(cm.sum())
+                row['confusion_matrix'] = cm
+                row['fit_time'] = sum(r['fit_time'] for r in ok)
+                row['predict_time'] = sum(r['predict_time'] for r in ok)
+            row['error'] = '; '.join(sorted(set(r['error'] for r in folds if r['error'])))
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def output_summary(self):
+        """
+        Stampa hit rate, matrice di confusione e tempi di ogni modello.
+        """
+        print("Hit Rates/Confusion Matrices:\n")
+        for _, row in self.summary().iterrows():
+            if row['folds'] == 0:
+                print("%s:\nfailed: %s\n" % (row['model'], row['error']))
+                continue
+            print("%s:\n%0.3f" % (row['model'], row['hit_rate']))
+            print("%s" % row['confusion_matrix'])
+            print("fit %0.3fs, predict %0.3fs\n" % (
+                row['fit_time'], row['predict_time'])
+            )
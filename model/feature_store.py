@@ -0,0 +1,220 @@
+# feature_store.py
+
+import datetime
+import hashlib
+import json
+import os, os.path
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data.csv_cache import CSV_COLUMNS, read_csv_columns
+
+
+class YahooPriceSource(object):
+    """
+    Prezzi giornalieri scaricati da Yahoo Finance con pandas_datareader,
+    come nella versione originale di create_lagged_series.
+    """
+
+    def key(self, symbol):
+        """
+        Restituisce la stringa che identifica i dati della sorgente
+        nella chiave della cache.
+        """
+        return 'yahoo'
+
+    def read(self, symbol, start_date, end_date):
+        """
+        Restituisce un DataFrame indicizzato per data con le colonne
+        'Adj Close' e 'Volume' delle barre tra start_date ed end_date.
+        """
+        # Importato solo quando serve, così le sorgenti locali
+        # funzionano anche senza pandas_datareader
+        import pandas_datareader as pdr
+        ts = pdr.DataReader(symbol, "yahoo", start_date, end_date)
+        return ts[["Adj Close", "Volume"]]
+
+
+class CSVPriceSource(object):
+    """
+    Prezzi giornalieri letti dai file <symbol>.csv di una directory locale,
+    nello stesso formato usato da HistoricCSVDataHandler.
+    """
+
+    def __init__(self, csv_dir, cache_dir=None):
+        """
+        Parametri:
+        csv_dir - La directory dei file CSV.
+        cache_dir - Directory opzionale della cache binaria dei CSV.
+        """
+        self.csv_dir = csv_dir
+        self.cache_dir = cache_dir
+
+    def _path(self, symbol):
+        return os.path.abspath(os.path.join(self.csv_dir, '%s.csv' % symbol))
+
+    def key(self, symbol):
+        # Il file modificato invalida le voci della cache
+        path = self._path(symbol)
+        st = os.stat(path)
+        return 'csv:%s:%d:%d' % (path, st.st_mtime_ns, st.st_size)
+
+    def read(self, symbol, start_date, end_date):
+        datetimes, columns = read_csv_columns(
+            self._path(symbol), CSV_COLUMNS['daily'], self.cache_dir
+        )
+        index = pd.DatetimeIndex(np.asarray(datetimes).view('datetime64[ns]'))
+        ts = pd.DataFrame(
+            {"Adj Close": columns['adj_close'], "Volume": columns['volume']},
+            index=index
+        ).sort_index()
+        return ts[(ts.index >= start_date) & (ts.index <= end_date)]
+
+
+class DatabasePriceSource(object):
+    """
+    Prezzi giornalieri letti dalla tabella daily_price del database
+    securities master (vedi database/db_mysql.py).
+    """
+
+    SQL = """SELECT dp.price_date, dp.adj_close_price, dp.volume
+             FROM symbol AS sym
+             INNER JOIN daily_price AS dp
+             ON dp.symbol_id = sym.id
+             WHERE sym.ticker = {0} AND dp.price_date BETWEEN {0} AND {0}
+             ORDER BY dp.price_date ASC;"""
+
+    def __init__(self, con, name='securities_master', placeholder='%s'):
+        """
+        Parametri:
+        con - Una connessione DB-API al database (es. DB().conn()).
+        name - Il nome del database, usato nella chiave della cache.
+        placeholder - Il segnaposto dei parametri del driver
+            ('%s' per MySQL, '?' per sqlite3).
+        """
+        self.con = con
+        self.name = name
+        self.placeholder = placeholder
+
+    def key(self, symbol):
+        return 'db:%s' % self.name
+
+    def read(self, symbol, start_date, end_date):
+        ts = pd.read_sql(
+            self.SQL.format(self.placeholder), self.con,
+            params=(symbol, start_date, end_date),
+            index_col='price_date', parse_dates=['price_date']
+        )
+        return pd.DataFrame({
+            "Adj Close": ts["adj_close_price"].astype(np.float64),
+            "Volume": ts["volume"].astype(np.float64),
+        }, index=ts.index)
+
+
+def lagged_returns_frame(ts, start_date, lags=5):
+    """
+    Calcola con operazioni vettoriali il DataFrame dei rendimenti
+    percentuali e dei rendimenti ritardati di create_lagged_series.
+
+    Parametri:
+    ts - DataFrame indicizzato per data con le colonne 'Adj Close' e 'Volume'.
+    start_date - La data della prima riga restituita.
+    lags - Il numero di rendimenti ritardati.
+    """
+    prices = np.asarray(ts["Adj Close"], dtype=np.float64)
+    n = len(prices)
+    returns = np.full(n, np.nan)
+    returns[1:] = (prices[1:] / prices[:-1] - 1.0) * 100.0
+
+    # I rendimenti prossimi a zero vengono sostituiti con un numero molto
+    # piccolo (in modo da evitare le criticità del modello QDA di Scikit-Learn)
+    today = np.where(np.abs(returns) < 0.0001, 0.0001, returns)
+
+    # Matrice dei rendimenti ritardati: la colonna k è il rendimento
+    # di k+1 barre prima
+    lagged = np.full((n, lags), np.nan)
+    for k in range(lags):
+        lagged[k + 1:, k] = returns[:n - k - 1]
+
+    tsret = pd.DataFrame(
+        np.column_stack((np.asarray(ts["Volume"], dtype=np.float64), today, lagged)),
+        index=ts.index,
+        columns=["Volume", "Today"] + ["Lag%s" % str(i+1) for i in range(lags)]
+    )
+    tsret["Direction"] = np.sign(today)
+    return tsret[tsret.index >= start_date]
+
+
+class FeatureStore(object):
+    """
+    FeatureStore calcola le serie dei rendimenti ritardati di
+    create_lagged_series e le memorizza su disco, con una voce per
+    combinazione di simbolo, intervallo di date, numero di ritardi e
+    sorgente dei prezzi. Le richieste successive leggono la voce dalla
+    cache (o dalla memoria, nello stesso processo) senza accedere alla
+    sorgente dei prezzi.
+
+    Le sorgenti dei prezzi (YahooPriceSource, CSVPriceSource,
+    DatabasePriceSource) espongono read(symbol, start_date, end_date) e
+    key(symbol); con CSVPriceSource la chiave include data di modifica e
+    dimensione del file, per cui un file aggiornato invalida la cache.
+    """
+
+    def __init__(self, cache_dir, source=None):
+        """
+        Parametri:
+        cache_dir - La directory dove memorizzare le serie calcolate.
+        source - La sorgente dei prezzi (per default YahooPriceSource).
+        """
+        self.cache_dir = cache_dir
+        self.source = YahooPriceSource() if source is None else source
+        self._memory = {}
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_path(self, symbol, start_date, end_date, lags):
+        """
+        Restituisce il file della voce di cache per la richiesta.
+        """
+        key = json.dumps([
+            symbol, pd.Timestamp(start_date).isoformat(),
+            pd.Timestamp(end_date).isoformat(), lags, self.source.key(symbol)
+        ])
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, '%s-%s.pkl' % (symbol, digest))
+
+    def lagged_series(self, symbol, start_date, end_date, lags=5):
+        """
+        Restituisce il DataFrame di create_lagged_series per symbol,
+        dalla cache se disponibile.
+        """
+        path = self._entry_path(symbol, start_date, end_date, lags)
+        try:
+            return self._memory[path].copy()
+        except KeyError:
+            pass
+        if os.path.exists(path):
+            tsret = pd.read_pickle(path)
+        else:
+            ts = self.source.read(
+                symbol, start_date - datetime.timedelta(days=365), end_date
+            )
+            tsret = lagged_returns_frame(ts, start_date, lags)
+            # Scrittura atomica: un'interruzione non lascia voci parziali
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            tsret.to_pickle(tmp)
+            os.replace(tmp, path)
+        self._memory[path] = tsret
+        return tsret.copy()
+
+    def clear(self):
+        """
+        Rimuove tutte le voci della cache.
+        """
+        self._memory = {}
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.pkl'):
+                os.remove(os.path.join(self.cache_dir, fname))
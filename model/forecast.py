@@ -9,7 +9,6 @@ import datetime
 import numpy as np
 import pandas as pd
 
-import pandas_datareader as pdr
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis as LDA
@@ -17,51 +16,34 @@ from sklearn.metrics import confusion_matrix
 from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis as QDA
 from sklearn.svm import LinearSVC, SVC
 
-def create_lagged_series(symbol, start_date, end_date, lags=5):
+from model.feature_store import YahooPriceSource, lagged_returns_frame
+from model.evaluation import ModelComparison
+
+def create_lagged_series(symbol, start_date, end_date, lags=5, source=None,
+                         store=None):
     """
     Questo crea un DataFrame Pandas che memorizza i rendimenti percentuali
     del prezzo di chiusura aggiustato delle barre di un titolo azionario scaricate
     da Yahoo Finance, e memorizza una serie di rendimenti ritardati dai giorni di
     negoziazione precedenti (il valore di ritardo predefinito è di 5 giorni).
     Sono inclusi anche i volume degli scambi, e la direzione del giorno precedente.
-    """
 
-    # Download dei ddti sulle azioni da Yahoo Finance
-    ts = pdr.DataReader(
-          symbol, "yahoo",
-          start_date-datetime.timedelta(days=365),
-          end_date
+    Parametri:
+    source - La sorgente dei prezzi (per default YahooPriceSource), ad
+        esempio CSVPriceSource o DatabasePriceSource per i dati locali.
+    store - Un FeatureStore opzionale da cui leggere la serie già
+        calcolata, al posto di source.
+    """
+    if store is not None:
+        return store.lagged_series(symbol, start_date, end_date, lags)
+    if source is None:
+        source = YahooPriceSource()
+
+    # Lettura dei dati sulle azioni, a partire da un anno prima
+    ts = source.read(
+          symbol, start_date-datetime.timedelta(days=365), end_date
          )
-
-    # Crea un nuovo DataFrame dei dati ritardati
-    tslag = pd.DataFrame(index=ts.index)
-    tslag["Today"] = ts["Adj Close"]
-    tslag["Volume"] = ts["Volume"]
-
-    # Crea una serie ritardata dei precendenti prezzi di chiusura dei periodi di trading
-    for i in range(0, lags):
-        tslag["Lag%s" % str(i+1)] = ts["Adj Close"].shift(i+1)
-
-    # Crea il Dataframe dei rendimenti
-    tsret = pd.DataFrame(index=tslag.index)
-    tsret["Volume"] = tslag["Volume"]
-    tsret["Today"] = tslag["Today"].pct_change()*100.0
-
-    # Se qualsiasi dei valori dei rendimenti percentuali è pari a zero, si imposta questi con
-    # un numero molto piccolo (in modo da evitare le criticità del modello QDA di Scikit-Learn)
-    for i,x in enumerate(tsret["Today"]):
-        if (abs(x) < 0.0001):
-            tsret["Today"][i] = 0.0001
-
-    # Crea la colonna dei rendimenti percentuali ritardati
-    for i in range(0, lags):
-        tsret["Lag%s" % str(i+1)] = tslag["Lag%s" % str(i+1)].pct_change()*100.0
-
-    # Crea la colonna "Direction" (+1 or -1) che indica un giorno rialzista/ribassista
-    tsret["Direction"] = np.sign(tsret["Today"])
-    tsret = tsret[tsret.index >= start_date]
-
-    return tsret
+    return lagged_returns_frame(ts, start_date, lags)
 
 if __name__ == "__main__":
     # Crea una serie ritardata dell'indice S&P500 del mercato azionario US
@@ -78,14 +60,7 @@ if __name__ == "__main__":
     # I dati di test sono divisi in due parti: prima e dopo il 1 gennaio 2005.
     start_test = datetime.datetime(2005,1,1)
 
-    # Crea il dataset di training e di test
-    X_train = X[X.index < start_test]
-    X_test = X[X.index >= start_test]
-    y_train = y[y.index < start_test]
-    y_test = y[y.index >= start_test]
-
     # Crea i modelli (parametrizzati)
-    print("Hit Rates/Confusion Matrices:\n")
     models = [("LR", LogisticRegression()),
               ("LDA", LDA()),
               ("QDA", QDA()),
@@ -99,20 +74,13 @@ if __name__ == "__main__":
               ("RF", RandomForestClassifier(
                  n_estimators=1000, criterion='gini',
                  max_depth=None, min_samples_split=2,
-                 min_samples_leaf=1, max_features='auto',
+                 min_samples_leaf=1, max_features='sqrt',
                  bootstrap=True, oob_score=False, n_jobs=1,
                  random_state=None, verbose=0)
                 )]
 
-    # Iterazione attraverso i modelli
-    for m in models:
-
-        # Addestramento di ogni modello con il set di dati di training
-        m[1].fit(X_train, y_train)
-
-        # Costruisce un array di predizioni sui dati di test
-        pred = m[1].predict(X_test)
-
-        # Stampa del hit-rate e della confusion matrix di ogni modello.
-        print("%s:\n%0.3f" % (m[0], m[1].score(X_test, y_test)))
-        print("%s\n" % confusion_matrix(pred, y_test))
\ No newline at end of file
+    # Addestramento e valutazione in parallelo di tutti i modelli
+    # con il training set prima del 2005 e il test set dal 2005
+    comparison = ModelComparison(models, X, y, start_test=start_test)
+    comparison.run()
+    comparison.output_summary()
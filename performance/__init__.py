@@ -1,2 +1,3 @@
 from .performance import *
+from .online import *
 from .sharpe_ratio import *
\ No newline at end of file
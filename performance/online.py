@@ -0,0 +1,166 @@
+# online.py
+
+import math
+
+
+class OnlineStats(object):
+    """
+    OnlineStats calcola le statistiche di performance del portafoglio
+    barra per barra, durante l'esecuzione, con memoria O(1): media e
+    varianza dei rendimenti con l'algoritmo di Welford, high water mark,
+    drawdown corrente e massimo con relativa durata, esposizione e turnover.
+
+    Le statistiche sono quindi disponibili in ogni momento, anche nel
+    live trading, e possono essere usate da regole di interruzione
+    anticipata del backtest (vedi max_drawdown_rule). Sharpe ratio e
+    drawdown coincidono con quelli di create_sharpe_ratio e
+    create_drawdowns calcolati sulla curva di equity finale.
+    """
+
+    def __init__(self, initial_capital, periods=252):
+        """
+        Inizializza l'accumulatore.
+
+        Parametri:
+        initial_capital - Il valore iniziale del portafoglio.
+        periods - Il numero di periodi in un anno, usato per annualizzare
+            lo Sharpe ratio (252 giornaliero, 252*6.5*60 al minuto).
+        """
+        self.initial_capital = initial_capital
+        self.periods = periods
+        self.bars = 0
+        self.total = initial_capital
+
+        # Welford
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+        # Drawdown sulla curva di equity (total / initial_capital)
+        self.hwm = 0.0
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.duration = 0
+        self.max_duration = 0
+
+        # Esposizione e turnover
+        self.exposure = 0.0
+        self._exposure_sum = 0.0
+        self._total_sum = 0.0
+        self.traded_value = 0.0
+
+    def update(self, total, gross_exposure=0.0, traded_value=0.0):
+        """
+        Aggiorna le statistiche con i valori dell'ultima barra.
+
+        Parametri:
+        total - Il valore totale del portafoglio.
+        gross_exposure - La somma dei valori assoluti delle posizioni.
+        traded_value - Il controvalore scambiato dall'ultimo aggiornamento.
+        """
+        self.traded_value += traded_value
+        if not math.isfinite(total):
+            return
+        self.bars += 1
+
+        if self.total != 0:
+            r = total / self.total - 1.0
+            self.count += 1
+            delta = r - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (r - self.mean)
+        self.total = total
+
+        equity = total / self.initial_capital
+        if equity > self.hwm:
+            self.hwm = equity
+        self.drawdown = self.hwm - equity
+        if self.drawdown == 0:
+            self.duration = 0
+        else:
+            self.duration += 1
+        if self.drawdown > self.max_drawdown:
+            self.max_drawdown = self.drawdown
+        if self.duration > self.max_duration:
+            self.max_duration = self.duration
+
+        self.exposure = gross_exposure / total if total != 0 else 0.0
+        self._exposure_sum += self.exposure
+        self._total_sum += total
+
+    @property
+    def variance(self):
+        """
+        La varianza (di popolazione) dei rendimenti per barra.
+        """
+        return self._m2 / self.count if self.count > 0 else float('nan')
+
+    @property
+    def total_return(self):
+        return self.total / self.initial_capital - 1.0
+
+    @property
+    def sharpe_ratio(self):
+        """
+        Lo Sharpe ratio annualizzato, con benchmark pari a zero.
+        """
+        std = math.sqrt(self.variance) if self.count > 0 else float('nan')
+        if not std > 0:
+            return float('nan')
+        return math.sqrt(self.periods) * self.mean / std
+
+    @property
+    def avg_exposure(self):
+        """
+        L'esposizione lorda media, in frazione del valore del portafoglio.
+        """
+        return self._exposure_sum / self.bars if self.bars > 0 else 0.0
+
+    @property
+    def turnover(self):
+        """
+        Il controvalore scambiato in rapporto al valore medio del portafoglio.
+        """
+        if self.bars == 0 or self._total_sum == 0:
+            return 0.0
+        return self.traded_value / (self._total_sum / self.bars)
+
+    def summary(self):
+        """
+        Restituisce un dizionario con le statistiche correnti.
+        """
+        return {
+            'bars': self.bars,
+            'total': self.total,
+            'total_return': self.total_return,
+            'sharpe_ratio': self.sharpe_ratio,
+            'drawdown': self.drawdown,
+            'max_drawdown': self.max_drawdown,
+            'drawdown_duration': self.duration,
+            'max_drawdown_duration': self.max_duration,
+            'exposure': self.exposure,
+            'avg_exposure': self.avg_exposure,
+            'turnover': self.turnover,
+        }
+
+
+class MaxDrawdownRule(object):
+    """
+    Regola di interruzione per Backtest che ferma il backtest quando il
+    drawdown corrente supera il limite indicato. È un oggetto e non una
+    closure così da poter essere inviata ai processi di uno sweep.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def __call__(self, stats):
+        return stats.drawdown > self.limit
+
+
+def max_drawdown_rule(limit):
+    """
+    Crea una regola di interruzione per Backtest che ferma il backtest
+    quando il drawdown corrente supera limit (es. 0.2 per il 20%).
+    """
+    return MaxDrawdownRule(limit)
@@ -27,24 +27,91 @@ def create_drawdowns(pnl):
     così come la durata del drawdown. Richiede che il pnl_returns
     sia una serie di pandas.
 
+    L'high water mark è calcolato con un massimo cumulativo e le durate
+    come distanza dall'ultimo istante senza drawdown, per cui il costo è
+    O(n) in operazioni vettoriali. Come nella versione con il ciclo, il
+    primo elemento delle serie è NaN, l'high water mark parte da zero e
+    la durata resta NaN fino al primo istante senza drawdown.
+
     Parametri:
     pnl - Una serie pandas che rappresenta i rendimenti percentuali del periodo.
 
     Restituisce:
     Drawdown, duration - Massimo drawdown picco-minimo e relativa durata.
     """
+    drawdown, duration = _drawdown_series(pnl)
+    return drawdown, drawdown.max(), duration.max()
+
 
-    # Calcola la curva cumulativa dei rendimenti
-    # e imposta un "High Water Mark"
-    # Quindi crea le serie dei drawdown e relative durate
-    hwm = [0]
+def _drawdown_series(pnl):
+    """
+    Restituisce le serie dei drawdown e delle relative durate della curva PnL.
+    """
     idx = pnl.index
-    drawdown = pd.Series(index = idx)
-    duration = pd.Series(index = idx)
-
-    # Ciclo sul range dell'indice
-    for t in range(1, len(idx)):
-        hwm.append(max(hwm[t-1], pnl[t]))
-        drawdown[t]= (hwm[t] - pnl[t])
-        duration[t]= (0 if drawdown[t] == 0 else duration[t-1] + 1)
-    return drawdown, drawdown.max(), duration.max()
\ No newline at end of file
+    values = np.asarray(pnl, dtype=np.float64)
+    n = len(values)
+    drawdown = np.full(n, np.nan)
+    duration = np.full(n, np.nan)
+    if n > 1:
+        # High water mark: massimo cumulativo a partire da zero,
+        # ignorando i valori NaN come faceva max() nel ciclo
+        hwm = np.fmax.accumulate(np.concatenate(([0.0], values[1:])))
+        drawdown[1:] = hwm[1:] - values[1:]
+
+        # La durata si azzera dove il drawdown è nullo e cresce di uno
+        # ad ogni barra successiva: è la distanza dall'ultimo azzeramento
+        positions = np.arange(n)
+        resets = np.where(drawdown == 0, positions, -1)
+        resets[0] = -1
+        last_reset = np.maximum.accumulate(resets)
+        duration[1:] = np.where(
+            last_reset[1:] >= 0, positions[1:] - last_reset[1:], np.nan
+        )
+    return pd.Series(drawdown, index=idx), pd.Series(duration, index=idx)
+
+
+def create_worst_drawdowns(pnl, top=5):
+    """
+    Individua i peggiori drawdown della curva PnL, ciascuno con la data
+    del picco, del minimo e del recupero (NaT se la curva non è ancora
+    tornata al picco).
+
+    Parametri:
+    pnl - Una serie pandas che rappresenta la curva PnL (es. equity_curve).
+    top - Il numero di drawdown da restituire.
+
+    Restituisce:
+    Un DataFrame ordinato per profondità con le colonne peak, trough,
+    recovery, drawdown e duration (barre dal picco al recupero o alla
+    fine della curva).
+    """
+    columns = ['peak', 'trough', 'recovery', 'drawdown', 'duration']
+    drawdown = _drawdown_series(pnl)[0].values
+    idx = pnl.index
+    n = len(drawdown)
+
+    # Un episodio di drawdown è una sequenza di barre con drawdown non nullo
+    in_dd = np.zeros(n + 1, dtype=bool)
+    in_dd[1:n] = drawdown[1:] != 0
+    edges = np.diff(np.concatenate(([False], in_dd)).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return pd.DataFrame(columns=columns)
+
+    depth = np.where(np.isnan(drawdown), -np.inf, drawdown)
+    depths = np.maximum.reduceat(depth[:n], starts)
+    worst = np.argsort(-depths, kind='stable')[:top]
+
+    rows = []
+    for k in worst:
+        start, end = starts[k], ends[k]
+        trough = start + np.argmax(depth[start:end])
+        rows.append({
+            'peak': idx[start - 1],
+            'trough': idx[trough],
+            'recovery': idx[end] if end < n else pd.NaT,
+            'drawdown': drawdown[trough],
+            'duration': end - start + 1 if end < n else n - start,
+        })
+    return pd.DataFrame(rows, columns=columns)
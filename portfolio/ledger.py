@@ -0,0 +1,319 @@
+# ledger.py
+
+import numpy as np
+import pandas as pd
+
+
+class PortfolioLedger(object):
+    """
+    PortfolioLedger memorizza lo storico delle posizioni e delle holdings
+    di un portafoglio in matrici NumPy preallocate (tempo x simbolo),
+    invece che in una lista di dizionari con una riga per barra.
+
+    La matrice delle holdings contiene il valore di mercato di ogni simbolo
+    seguito dalle colonne cash, commission e total, così che il DataFrame
+    della curva di equity possa essere costruito alla fine senza copie.
+    Quando la capacità è esaurita le matrici crescono di almeno chunk_size
+    righe alla volta.
+    """
+
+    def __init__(self, symbol_list, chunk_size=4096):
+        """
+        Inizializza il ledger vuoto.
+
+        Parametri:
+        symbol_list - L'elenco dei simboli del portafoglio.
+        chunk_size - Il numero minimo di righe aggiunte ad ogni crescita.
+        """
+        self.symbol_list = list(symbol_list)
+        self.holdings_columns = self.symbol_list + ['cash', 'commission', 'total']
+        self.chunk_size = chunk_size
+        self.size = 0
+        n = len(self.symbol_list)
+        self._datetimes = np.empty(chunk_size, dtype=np.int64)
+        self._positions = np.zeros((chunk_size, n), dtype=np.float64)
+        self._holdings = np.zeros((chunk_size, n + 3), dtype=np.float64)
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_arrays(cls, symbol_list, datetimes, positions, holdings):
+        """
+        Crea un ledger già completo dalle matrici calcolate in blocco
+        (es. da VectorizedBacktest), usandole direttamente senza copie.
+
+        Parametri:
+        symbol_list - L'elenco dei simboli del portafoglio.
+        datetimes - Array int64 dei timestamp delle righe, in nanosecondi.
+        positions - Matrice (righe x simboli) delle posizioni.
+        holdings - Matrice delle holdings: valori di mercato dei simboli
+            seguiti da cash, commission e total.
+        """
+        ledger = PortfolioLedger(symbol_list, chunk_size=1)
+        ledger._datetimes = np.asarray(datetimes, dtype=np.int64)
+        ledger._positions = np.asarray(positions, dtype=np.float64)
+        ledger._holdings = np.asarray(holdings, dtype=np.float64)
+        ledger.size = len(ledger._datetimes)
+        return ledger
+
+    def _grow(self):
+        """
+        Aumenta la capacità delle matrici copiando le righe esistenti.
+        """
+        capacity = len(self._datetimes) + max(self.chunk_size, len(self._datetimes))
+        datetimes = np.empty(capacity, dtype=np.int64)
+        positions = np.zeros((capacity, self._positions.shape[1]), dtype=np.float64)
+        holdings = np.zeros((capacity, self._holdings.shape[1]), dtype=np.float64)
+        datetimes[:self.size] = self._datetimes[:self.size]
+        positions[:self.size] = self._positions[:self.size]
+        holdings[:self.size] = self._holdings[:self.size]
+        self._datetimes = datetimes
+        self._positions = positions
+        self._holdings = holdings
+
+    def append(self, dt, positions, market_values, cash, commission, total):
+        """
+        Aggiunge una riga al ledger.
+
+        Parametri:
+        dt - Il timestamp della barra.
+        positions - Le quantità detenute per ogni simbolo.
+        market_values - Il valore di mercato di ogni simbolo.
+        cash - La liquidità disponibile.
+        commission - Le commissioni cumulate.
+        total - Il valore totale del portafoglio.
+        """
+        if self.size == len(self._datetimes):
+            self._grow()
+        i = self.size
+        self._datetimes[i] = pd.Timestamp(dt).value
+        self._positions[i] = positions
+        row = self._holdings[i]
+        row[:-3] = market_values
+        row[-3] = cash
+        row[-2] = commission
+        row[-1] = total
+        self.size += 1
+
+    def record(self, dt, positions, prices, cash, commission):
+        """
+        Registra la barra corrente a partire dal vettore delle posizioni e
+        dal vettore dei prezzi di tutti i simboli, calcolando i valori di
+        mercato e il totale con operazioni vettoriali.
+
+        Parametri:
+        dt - Il timestamp della barra.
+        positions - Array delle quantità detenute, nell'ordine di symbol_list.
+        prices - Array degli ultimi prezzi, nell'ordine di symbol_list.
+        cash - La liquidità disponibile.
+        commission - Le commissioni cumulate.
+
+        Restituisce il valore totale e i valori di mercato registrati.
+        """
+        market_values = positions * prices
+        total = cash + positions.dot(prices)
+        self.append(dt, positions, market_values, cash, commission, total)
+        return total, market_values
+
+    @property
+    def datetimes(self):
+        """
+        L'indice temporale delle righe registrate.
+        """
+        return pd.DatetimeIndex(
+            self._datetimes[:self.size].view('datetime64[ns]'), name='datetime'
+        )
+
+    @property
+    def positions(self):
+        """
+        La matrice (righe x simboli) delle posizioni registrate.
+        """
+        return self._positions[:self.size]
+
+    @property
+    def holdings(self):
+        """
+        La matrice delle holdings registrate: valori di mercato dei
+        simboli seguiti da cash, commission e total.
+        """
+        return self._holdings[:self.size]
+
+    def positions_frame(self):
+        """
+        Restituisce le posizioni come DataFrame indicizzato per data.
+        """
+        return pd.DataFrame(
+            self.positions, index=self.datetimes,
+            columns=self.symbol_list, copy=False
+        )
+
+    def holdings_frame(self):
+        """
+        Restituisce le holdings come DataFrame indicizzato per data,
+        costruito direttamente sulla matrice del ledger senza copie.
+        """
+        return pd.DataFrame(
+            self.holdings, index=self.datetimes,
+            columns=self.holdings_columns, copy=False
+        )
+
+    def to_records(self, frame):
+        """
+        Converte un DataFrame del ledger nella lista di dizionari
+        (una riga per barra, con la chiave 'datetime') usata in precedenza.
+        """
+        records = frame.to_dict('records')
+        for dt, d in zip(frame.index, records):
+            d['datetime'] = dt
+        return records
+
+
+class SparsePortfolioLedger(PortfolioLedger):
+    """
+    SparsePortfolioLedger registra per ogni barra solo cash, commission,
+    total e le posizioni diverse da zero, invece di una riga completa per
+    tutti i simboli dell'universo. Il lavoro e la memoria per barra sono
+    quindi proporzionali al numero di posizioni aperte.
+
+    Le matrici complete delle posizioni e delle holdings vengono
+    ricostruite solo quando richieste, ad esempio dalla creazione
+    della curva di equity.
+    """
+
+    def __init__(self, symbol_list, chunk_size=4096):
+        """
+        Inizializza il ledger vuoto.
+
+        Parametri:
+        symbol_list - L'elenco dei simboli del portafoglio.
+        chunk_size - Il numero minimo di righe aggiunte ad ogni crescita.
+        """
+        self.symbol_list = list(symbol_list)
+        self.holdings_columns = self.symbol_list + ['cash', 'commission', 'total']
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.entries = 0
+        self._datetimes = np.empty(chunk_size, dtype=np.int64)
+        self._totals = np.empty((chunk_size, 3), dtype=np.float64)
+        self._entry_bar = np.empty(chunk_size, dtype=np.int64)
+        self._entry_symbol = np.empty(chunk_size, dtype=np.int64)
+        self._entry_position = np.empty(chunk_size, dtype=np.float64)
+        self._entry_value = np.empty(chunk_size, dtype=np.float64)
+        self._dense = None
+
+    def _grow(self):
+        """
+        Aumenta la capacità degli array per barra.
+        """
+        capacity = len(self._datetimes) + max(self.chunk_size, len(self._datetimes))
+        datetimes = np.empty(capacity, dtype=np.int64)
+        totals = np.empty((capacity, 3), dtype=np.float64)
+        datetimes[:self.size] = self._datetimes[:self.size]
+        totals[:self.size] = self._totals[:self.size]
+        self._datetimes = datetimes
+        self._totals = totals
+
+    def _grow_entries(self, n):
+        """
+        Aumenta la capacità degli array delle posizioni aperte per
+        contenere almeno n nuove voci.
+        """
+        needed = self.entries + n
+        capacity = len(self._entry_bar)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity + max(self.chunk_size, capacity))
+        for name in ('_entry_bar', '_entry_symbol', '_entry_position', '_entry_value'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.entries] = old[:self.entries]
+            setattr(self, name, new)
+
+    def _append_sparse(self, dt, symbols, positions, market_values, cash,
+                       commission, total):
+        """
+        Aggiunge una barra con le sole posizioni aperte indicate.
+        """
+        if self.size == len(self._datetimes):
+            self._grow()
+        i = self.size
+        self._datetimes[i] = pd.Timestamp(dt).value
+        self._totals[i] = (cash, commission, total)
+        n = len(symbols)
+        if n > 0:
+            self._grow_entries(n)
+            k = self.entries
+            self._entry_bar[k:k + n] = i
+            self._entry_symbol[k:k + n] = symbols
+            self._entry_position[k:k + n] = positions
+            self._entry_value[k:k + n] = market_values
+            self.entries += n
+        self.size += 1
+        self._dense = None
+
+    def append(self, dt, positions, market_values, cash, commission, total):
+        """
+        Aggiunge una riga al ledger a partire dai vettori completi delle
+        posizioni e dei valori di mercato, conservando solo i simboli
+        con una posizione aperta.
+        """
+        positions = np.broadcast_to(
+            np.asarray(positions, dtype=np.float64), (len(self.symbol_list),)
+        )
+        market_values = np.broadcast_to(
+            np.asarray(market_values, dtype=np.float64), (len(self.symbol_list),)
+        )
+        symbols = np.flatnonzero(positions)
+        self._append_sparse(
+            dt, symbols, positions[symbols], market_values[symbols],
+            cash, commission, total
+        )
+
+    def record(self, dt, positions, prices, cash, commission):
+        """
+        Registra la barra corrente valorizzando solo le posizioni aperte.
+        I simboli senza posizione non contribuiscono al totale, anche se
+        il loro prezzo non è ancora disponibile (NaN).
+        """
+        symbols = np.flatnonzero(positions)
+        open_positions = positions[symbols]
+        market_values = open_positions * prices[symbols]
+        total = cash + market_values.sum()
+        self._append_sparse(
+            dt, symbols, open_positions, market_values, cash, commission, total
+        )
+        return total, market_values
+
+    def _densify(self):
+        """
+        Ricostruisce e memorizza le matrici complete delle posizioni
+        e delle holdings a partire dalle voci registrate.
+        """
+        if self._dense is None:
+            n = len(self.symbol_list)
+            positions = np.zeros((self.size, n), dtype=np.float64)
+            holdings = np.zeros((self.size, n + 3), dtype=np.float64)
+            bars = self._entry_bar[:self.entries]
+            symbols = self._entry_symbol[:self.entries]
+            positions[bars, symbols] = self._entry_position[:self.entries]
+            holdings[bars, symbols] = self._entry_value[:self.entries]
+            holdings[:, n:] = self._totals[:self.size]
+            self._dense = (positions, holdings)
+        return self._dense
+
+    @property
+    def positions(self):
+        """
+        La matrice (righe x simboli) delle posizioni, ricostruita
+        dalle voci registrate.
+        """
+        return self._densify()[0]
+
+    @property
+    def holdings(self):
+        """
+        La matrice delle holdings, ricostruita dalle voci registrate.
+        """
+        return self._densify()[1]
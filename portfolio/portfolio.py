@@ -16,6 +16,8 @@ from math import floor
 
 from event.event import FillEvent, OrderEvent
 from performance.performance import create_sharpe_ratio, create_drawdowns
+from performance.online import OnlineStats
+from portfolio.ledger import PortfolioLedger, SparsePortfolioLedger
 
 # portfolio.py
 
@@ -53,7 +55,8 @@ class NaivePortfolio(Portfolio):
     utilizzato per testare strategie più semplici come BuyAndHoldStrategy.
     """
 
-    def __init__(self, bars, events, start_date, initial_capital=100000.0):
+    def __init__(self, bars, events, start_date, initial_capital=100000.0,
+                 sparse=False):
         """
         Inizializza il portfolio con la coda delle barre e degli eventi.
         Include anche un indice datetime iniziale e un capitale iniziale
@@ -64,41 +67,57 @@ class NaivePortfolio(Portfolio):
         events: l'oggetto Event Queue (coda di eventi).
         start_date - La data di inizio (barra) del portfolio.
         initial_capital - Il capitale iniziale in USD.
+        sparse - Se True registra ad ogni barra solo le posizioni aperte
+            (SparsePortfolioLedger), utile per universi ampi con poche
+            posizioni contemporanee.
         """
         self.bars = bars
         self.events = events
         self.symbol_list = self.bars.symbol_list
         self.start_date = start_date
         self.initial_capital = initial_capital
+        self.sparse = sparse
 
-        self.all_positions = self.construct_all_positions()
         self.current_positions = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
-
-        self.all_holdings = self.construct_all_holdings()
+        self.symbol_index = dict((s, j) for j, s in enumerate(self.symbol_list))
+        self.position_vector = np.zeros(len(self.symbol_list))
         self.current_holdings = self.construct_current_holdings()
+        self.ledger = self.construct_ledger()
+        self.stats = OnlineStats(self.initial_capital, periods=252)
+        self._traded_value = 0.0
 
 
-    def construct_all_positions(self):
+    def construct_ledger(self):
+        """
+        Costruisce il ledger delle posizioni e delle partecipazioni
+        utilizzando start_date per determinare quando inizierà
+        l'indice temporale.
+        """
+        if self.sparse:
+            ledger = SparsePortfolioLedger(self.symbol_list)
+        else:
+            ledger = PortfolioLedger(self.symbol_list)
+        ledger.append(
+            self.start_date, 0.0, 0.0, self.initial_capital,
+            0.0, self.initial_capital
+        )
+        return ledger
+
+
+    @property
+    def all_positions(self):
         """
-        Costruisce l'elenco delle posizioni utilizzando start_date
-        per determinare quando inizierà l'indice temporale.
+        Lo storico delle posizioni come lista di dizionari, una per barra.
         """
-        d = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
-        d['datetime'] = self.start_date
-        return [d]
+        return self.ledger.to_records(self.ledger.positions_frame())
 
 
-    def construct_all_holdings(self):
+    @property
+    def all_holdings(self):
         """
-        Costruisce l'elenco delle partecipazioni utilizzando start_date
-        per determinare quando inizierà l'indice temporale.
+        Lo storico delle holdings come lista di dizionari, una per barra.
         """
-        d = dict( (k,v) for k, v in [(s, 0.0) for s in self.symbol_list] )
-        d['datetime'] = self.start_date
-        d['cash'] = self.initial_capital
-        d['commission'] = 0.0
-        d['total'] = self.initial_capital
-        return [d]
+        return self.ledger.to_records(self.ledger.holdings_frame())
 
 
     def construct_current_holdings(self):
@@ -125,32 +144,20 @@ class NaivePortfolio(Portfolio):
                                 self.symbol_list[0]
                             )
 
-        # Update positions
-        dp = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
-        dp['datetime'] = latest_datetime
-
-        for s in self.symbol_list:
-            dp[s] = self.current_positions[s]
-
-        # Aggiunge le posizioni correnti
-        self.all_positions.append(dp)
-
-        # Aggiorno delle holdings
-        dh = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
-        dh['datetime'] = latest_datetime
-        dh['cash'] = self.current_holdings['cash']
-        dh['commission'] = self.current_holdings['commission']
-        dh['total'] = self.current_holdings['cash']
-
-        for s in self.symbol_list:
-            # Approossimazione ad un valore reale
-            market_value = self.current_positions[s] * \
-                            self.bars.get_latest_bar_value(s, "adj_close")
-            dh[s] = market_value
-            dh['total'] += market_value
+        # Approssimazione ad un valore reale, calcolata per tutti
+        # i simboli con un'unica operazione vettoriale, e aggiunta
+        # delle posizioni e delle holdings correnti al ledger
+        total, market_values = self.ledger.record(
+            latest_datetime, self.position_vector,
+            self.bars.get_latest_symbols_value("adj_close"),
+            self.current_holdings['cash'], self.current_holdings['commission']
+        )
 
-        # Aggiunta alle holdings correnti
-        self.all_holdings.append(dh)
+        # Aggiornamento delle statistiche di performance in tempo reale
+        self.stats.update(
+            total, np.nansum(np.abs(market_values)), self._traded_value
+        )
+        self._traded_value = 0.0
 
 
     def update_positions_from_fill(self, fill):
@@ -170,6 +177,8 @@ class NaivePortfolio(Portfolio):
 
         # Aggiorna le posizioni con le nuove quantità
         self.current_positions[fill.symbol] += fill_dir * fill.quantity
+        self.position_vector[self.symbol_index[fill.symbol]] = \
+            self.current_positions[fill.symbol]
 
 
     def update_holdings_from_fill(self, fill):
@@ -191,6 +200,7 @@ class NaivePortfolio(Portfolio):
         fill_cost = self.bars.get_latest_bar_value(fill.symbol, "adj_close")  # Close price
         cost = fill_dir * fill_cost * fill.quantity
         self.current_holdings[fill.symbol] += cost
+        self._traded_value += abs(cost)
         self.current_holdings['commission'] += fill.commission
         self.current_holdings['cash'] -= (cost + fill.commission)
         self.current_holdings['total'] -= (cost + fill.commission)
@@ -248,10 +258,9 @@ class NaivePortfolio(Portfolio):
 
     def create_equity_curve_dataframe(self):
         """
-        Crea un DataFrame pandas dalla lista di dizionari "all_holdings"
+        Crea un DataFrame pandas dalle holdings registrate nel ledger
         """
-        curve = pd.DataFrame(self.all_holdings)
-        curve.set_index('datetime', inplace=True)
+        curve = self.ledger.holdings_frame()
         curve['returns'] = curve['total'].pct_change()
         curve['equity_curve'] = (1.0+curve['returns']).cumprod()
         self.equity_curve = curve
@@ -5,10 +5,11 @@
 # snp_forecast.py
 
 import datetime
+import numpy as np
 import pandas as pd
 from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis as QDA
 
-from strategy import Strategy
+from strategy import MLForecastStrategy, lagged_returns
 from event import SignalEvent
 from backtest import Backtest
 from data import HistoricCSVDataHandler
@@ -16,31 +17,63 @@ from execution import SimulatedExecutionHandler
 from portfolio import Portfolio
 from model import create_lagged_series
 
-class SPYDailyForecastStrategy(Strategy):
+class SPYDailyForecastStrategy(MLForecastStrategy):
     """
     Strategia previsionale dell'S&P500. Usa un Quadratic Discriminant
     Analyser per prevedere i rendimenti per uno determinato sottoperiodo
     e quindi genera segnali long e di uscita basati sulla previsione.
+
+    Le previsioni di tutte le barre sono calcolate in blocco
+    all'inizializzazione (vedi MLForecastStrategy) a partire dai rendimenti
+    dei due giorni precedenti, già noti alla chiusura della barra.
     """
-    def __init__(self, bars, events):
-        self.bars = bars
-        self.symbol_list = self.bars.symbol_list
-        self.events = events
+
+    # Per Lag1 e Lag2 bastano le ultime tre barre
+    feature_lookback = 3
+
+    def __init__(self, bars, events, refit_every=None, feature_store=None):
+        """
+        Parametri:
+        bars - L'oggetto DataHandler che fornisce i dati di mercato.
+        events - L'oggetto Event Queue.
+        refit_every - Se indicato, invece di usare il modello addestrato
+            sui dati del periodo 2001-2004, il QDA viene riaddestrato ogni
+            refit_every barre sullo storico del data handler.
+        feature_store - Un FeatureStore opzionale da cui leggere i dati
+            di addestramento già calcolati, invece di scaricarli ad ogni
+            avvio (es. FeatureStore(cache_dir, CSVPriceSource(csv_dir))).
+        """
         self.datetime_now = datetime.datetime.utcnow()
         self.model_start_date = datetime.datetime(2001,1,10)
         self.model_end_date = datetime.datetime(2005,12,31)
         self.model_start_test_date = datetime.datetime(2005,1,1)
         self.long_market = False
         self.short_market = False
-        self.bar_index = 0
-        self.model = self.create_symbol_forecast_model()
+        self.feature_store = feature_store
+        super(SPYDailyForecastStrategy, self).__init__(
+            bars, events, refit_every=refit_every
+        )
+
+    def create_model(self):
+        if self.refit_every is not None:
+            return QDA()
+        return self.create_symbol_forecast_model()
+
+    def create_features(self, datetimes, columns):
+        return lagged_returns(columns["adj_close"], lags=2)
+
+    def create_target(self, datetimes, columns):
+        # Direzione (+1 o -1) del rendimento della barra successiva
+        returns = pd.Series(columns["adj_close"]).pct_change() * 100.0
+        returns[returns.abs() < 0.0001] = 0.0001
+        return np.sign(returns.shift(-1)).values
 
     def create_symbol_forecast_model(self):
         # Creazione delle serie ritardate dell'indice S&P500
         # del mercato azionario US
         snpret = create_lagged_series(
             self.symbol_list[0], self.model_start_date,
-            self.model_end_date, lags=5
+            self.model_end_date, lags=5, store=self.feature_store
         )
         # Uso i rendimenti dei due giorni precedenti come valore
         # previsionale, con direzione come risposta
@@ -64,16 +97,9 @@ class SPYDailyForecastStrategy(Strategy):
         sym = self.symbol_list[0]
         dt = self.datetime_now
         if event.type == 'MARKET':
-            self.bar_index += 1
-            if self.bar_index > 5:
-                lags = self.bars.get_latest_bars_values(
-                    self.symbol_list[0], "returns", N=3
-                )
-            pred_series = pd.Series({
-                                    'Lag1': lags[1] * 100.0,
-                                    'Lag2': lags[2] * 100.0
-                                    })
-            pred = self.model.predict(pred_series)
+            # Previsione precalcolata per la barra corrente,
+            # NaN finché non sono noti i due rendimenti precedenti
+            pred = self.latest_prediction(sym)
             if pred > 0 and not self.long_market:
                 self.long_market = True
                 signal = SignalEvent(1, sym, dt, 'LONG', 1.0)
@@ -1 +1,2 @@
-from .strategy import *
\ No newline at end of file
+from .strategy import *
+from .ml_strategy import *
@@ -0,0 +1,204 @@
+# ml_strategy.py
+
+import numpy as np
+import pandas as pd
+
+from strategy.strategy import Strategy
+
+
+class LookAheadError(Exception):
+    """
+    Sollevata quando una previsione dipende da dati successivi
+    alla barra in cui verrebbe usata.
+    """
+    pass
+
+
+class MLForecastStrategy(Strategy):
+    """
+    MLForecastStrategy è la classe base delle strategie che usano un
+    modello di machine learning (con l'interfaccia fit / predict di
+    scikit-learn) per prevedere la barra successiva.
+
+    Invece di costruire le feature e chiamare predict() ad ogni barra, la
+    matrice delle feature viene calcolata all'inizializzazione su tutte le
+    barre del data handler, con operazioni vettoriali, e le previsioni
+    dell'intervallo del backtest sono ottenute con una sola chiamata a
+    predict() oppure, con refit_every, a blocchi di refit_every barre
+    riaddestrando il modello prima di ogni blocco (walk-forward) sulle
+    sole barre precedenti. Durante il backtest latest_prediction()
+    restituisce la previsione memorizzata per la barra corrente.
+
+    Protezione dal look-ahead: ogni riga delle feature deve dipendere solo
+    dalle barre fino alla propria. All'inizializzazione, su un campione di
+    lookahead_checks barre, le feature vengono ricalcolate sul solo storico
+    disponibile in quel momento e confrontate con quelle precalcolate;
+    durante il backtest ogni previsione viene servita solo se la barra
+    corrente coincide con la sua barra e segue i dati usati per
+    calcolarla e per addestrare il modello. In caso contrario viene
+    sollevata LookAheadError.
+
+    Richiede un data handler con lo storico completo dei simboli in un
+    BarStore (es. HistoricCSVDataHandler).
+    """
+
+    # Numero di barre necessarie per calcolare una riga delle feature,
+    # usato dai controlli di look-ahead (None = tutto lo storico)
+    feature_lookback = None
+
+    def __init__(self, bars, events, refit_every=None, min_train_size=50,
+                 lookahead_checks=20):
+        """
+        Inizializza la strategia e precalcola le previsioni.
+
+        Parametri:
+        bars - L'oggetto DataHandler che fornisce i dati di mercato.
+        events - L'oggetto Event Queue.
+        refit_every - Se indicato, il modello viene riaddestrato ogni
+            refit_every barre sulle barre precedenti, altrimenti
+            create_model() deve restituire un modello già addestrato.
+        min_train_size - Il numero minimo di righe per riaddestrare il
+            modello; i blocchi con meno righe restano senza previsioni.
+        lookahead_checks - Il numero di barre su cui verificare che le
+            feature non usino dati futuri (0 per non verificarle).
+        """
+        self.bars = bars
+        self.symbol_list = self.bars.symbol_list
+        self.events = events
+        self.refit_every = refit_every
+        self.min_train_size = min_train_size
+        self.lookahead_checks = lookahead_checks
+        self.model = self.create_model()
+        self.predictions = {}
+        self._datetimes = {}
+        self._available_from = {}
+        for s in self.symbol_list:
+            self.precompute_predictions(s)
+
+    def create_model(self):
+        """
+        Restituisce il modello: già addestrato se refit_every è None,
+        altrimenti da addestrare a blocchi con create_target().
+        """
+        raise NotImplementedError("Should implement create_model()")
+
+    def create_features(self, datetimes, columns):
+        """
+        Restituisce un DataFrame delle feature con una riga per barra, in
+        cui la riga di ogni barra dipende solo dalle barre fino a quella.
+
+        Parametri:
+        datetimes - L'array dei timestamp delle barre.
+        columns - Dizionario campo -> array dei valori delle barre.
+        """
+        raise NotImplementedError("Should implement create_features()")
+
+    def create_target(self, datetimes, columns):
+        """
+        Restituisce l'array della variabile da prevedere per ogni barra,
+        che dipende dalla barra successiva (es. la direzione del suo
+        rendimento). Necessario solo con refit_every.
+        """
+        raise NotImplementedError("Should implement create_target()")
+
+    def _check_lookahead(self, symbol, datetimes, columns, features):
+        """
+        Ricalcola le feature di un campione di barre usando solo lo storico
+        disponibile fino ad ognuna e le confronta con quelle precalcolate.
+        """
+        n = len(datetimes)
+        if self.lookahead_checks <= 0 or n == 0:
+            return
+        for i in np.unique(np.linspace(0, n - 1, self.lookahead_checks).astype(int)):
+            i0 = 0 if self.feature_lookback is None else max(i + 1 - self.feature_lookback, 0)
+            known = self.create_features(
+                datetimes[i0:i + 1],
+                dict((f, v[i0:i + 1]) for f, v in columns.items())
+            )
+            expected = np.asarray(features.iloc[i], dtype=np.float64)
+            actual = np.asarray(known.iloc[-1], dtype=np.float64)
+            if not np.allclose(actual, expected, rtol=1e-9, atol=1e-12, equal_nan=True):
+                raise LookAheadError(
+                    "Features of %s at %s depend on later bars." % (
+                        symbol, pd.Timestamp(datetimes[i]))
+                )
+
+    def precompute_predictions(self, symbol):
+        """
+        Calcola le feature di tutte le barre di symbol e le previsioni
+        delle barre dell'intervallo del backtest, in un'unica chiamata a
+        predict() o a blocchi di refit_every barre.
+        """
+        store = self.bars.symbol_data[symbol]
+        datetimes = store.datetimes
+        columns = store.columns
+        features = self.create_features(datetimes, columns)
+        self._check_lookahead(symbol, datetimes, columns, features)
+
+        n = len(datetimes)
+        X = features.values
+        valid = np.isfinite(X).all(axis=1)
+        predictions = np.full(n, np.nan)
+        # Indice della prima barra in cui ogni previsione è utilizzabile:
+        # la barra stessa o, con il refit, quella in cui è noto l'ultimo
+        # valore della variabile usato per l'addestramento
+        available_from = np.arange(n)
+
+        if self.refit_every is None:
+            rows = np.flatnonzero(valid[store.start:store.end]) + store.start
+            if len(rows) > 0:
+                predictions[rows] = self.model.predict(features.iloc[rows])
+        else:
+            y = np.asarray(self.create_target(datetimes, columns), dtype=np.float64)
+            train = valid & np.isfinite(y)
+            for c in range(store.start, store.end, self.refit_every):
+                # La variabile della barra t è nota alla barra t + 1,
+                # per cui alla barra c si addestra sulle righe t < c
+                train_rows = np.flatnonzero(train[:c])
+                if len(train_rows) < self.min_train_size:
+                    continue
+                self.model.fit(features.iloc[train_rows], y[train_rows])
+                block = np.arange(c, min(c + self.refit_every, store.end))
+                rows = block[valid[block]]
+                if len(rows) > 0:
+                    predictions[rows] = self.model.predict(features.iloc[rows])
+                available_from[block] = np.maximum(block, train_rows[-1] + 1)
+
+        self.predictions[symbol] = predictions
+        self._datetimes[symbol] = datetimes
+        self._available_from[symbol] = available_from
+
+    def latest_prediction(self, symbol):
+        """
+        Restituisce la previsione per l'ultima barra di symbol (NaN se
+        non disponibile), verificando che non usi dati successivi.
+        """
+        dt = self.bars.get_latest_bar_datetime(symbol).value
+        datetimes = self._datetimes[symbol]
+        i = int(np.searchsorted(datetimes, dt))
+        if i >= len(datetimes) or datetimes[i] != dt:
+            raise LookAheadError(
+                "No precomputed prediction of %s for %s." % (symbol, pd.Timestamp(dt))
+            )
+        if self._available_from[symbol][i] > i:
+            raise LookAheadError(
+                "Prediction of %s for %s uses later bars." % (symbol, pd.Timestamp(dt))
+            )
+        return self.predictions[symbol][i]
+
+
+def lagged_returns(prices, lags):
+    """
+    Restituisce un DataFrame con i rendimenti percentuali ritardati delle
+    barre: la colonna LagK della barra t è il rendimento della barra
+    t - K + 1, cioè l'ultimo rendimento noto è Lag1, come nelle feature
+    di create_lagged_series per la barra successiva.
+
+    Parametri:
+    prices - Array dei prezzi (es. adj_close).
+    lags - Il numero di rendimenti ritardati.
+    """
+    returns = pd.Series(np.asarray(prices, dtype=np.float64)).pct_change() * 100.0
+    return pd.DataFrame(dict(
+        ("Lag%s" % (k + 1), returns.shift(k).values) for k in range(lags)
+    ))
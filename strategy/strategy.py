@@ -37,6 +37,24 @@ class Strategy(object):
         """
         raise NotImplementedError("Should implement calculate_signals()")
 
+    @classmethod
+    def vectorized_positions(cls, bars, **params):
+        """
+        Calcola con operazioni vettoriali le posizioni della strategia su
+        tutte le barre in una sola volta, per VectorizedBacktest. Può essere
+        implementato solo dalle strategie i cui segnali dipendono dalle
+        serie dei prezzi e non dallo stato del portafoglio.
+
+        Parametri:
+        bars - Dizionario campo -> matrice (barre x simboli) dei valori,
+            nell'ordine di symbol_list.
+        params - I parametri della strategia (come strategy_params).
+
+        Restituisce una matrice (barre x simboli) delle quantità da
+        detenere dopo ogni barra; NaN mantiene la posizione precedente.
+        """
+        raise NotImplementedError("Should implement vectorized_positions()")
+
 
 
 class BuyAndHoldStrategy(Strategy):